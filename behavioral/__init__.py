@@ -0,0 +1,45 @@
+'''behavioral design patterns; each submodule is imported only when one of its names is first used'''
+import importlib
+
+# public name -> submodule defining it; submodules are imported on first access
+_EXPORTS = {
+    "Observer": "observer_pattern",
+    "EventBus": "observer_pattern",
+    "ThreadedEventBus": "observer_pattern",
+    "AsyncEventBus": "observer_pattern",
+    "State": "state_pattern",
+    "StateMachine": "state_pattern",
+    "EntityStates": "state_pattern",
+    "OrderState": "state_pattern",
+    "Pending": "state_pattern",
+    "Paid": "state_pattern",
+    "Shipped": "state_pattern",
+    "Delivered": "state_pattern",
+    "Cancelled": "state_pattern",
+    "Refunded": "state_pattern",
+    "DiscountStrategy": "strategy_pattern",
+    "NoDiscount": "strategy_pattern",
+    "PercentageDiscount": "strategy_pattern",
+    "FixedAmountDiscount": "strategy_pattern",
+    "CompositeDiscount": "strategy_pattern",
+    "ChainedDiscount": "strategy_pattern",
+    "BestOfDiscount": "strategy_pattern",
+    "ShoppingCart": "strategy_pattern",
+    "CartStore": "strategy_pattern",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    # cache it, so later lookups bypass __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,512 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional, Union
+import asyncio
+import inspect
+import logging
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+
+'''an observer is notified of every event published on the topics it subscribed to'''
+class Observer(ABC):
+
+    @abstractmethod
+    def update(self, topic: str, event: Any):
+        pass
+
+
+'''one observer subscribed to one topic, plus its mailbox when delivery is deferred'''
+class _Subscription:
+    __slots__ = ('ref', 'function', 'is_coroutine', 'pending', 'scheduled', 'dropped')
+
+    def __init__(self, target, function: Optional[Callable]):
+        # only the observer object is held weakly; `function` is a plain function called as function(target, ...)
+        self.ref = weakref.ref(target)
+        self.function = function
+        self.is_coroutine = inspect.iscoroutinefunction(function or target)
+        # deque of (topic, event), created on first use so idle subscribers cost no mailbox
+        self.pending = None
+        self.scheduled = False
+        self.dropped = 0
+
+    def offer(self, items: list, max_pending: int, overflow: str) -> list:
+        '''queue items under the overflow policy; return the items that have to wait for room'''
+        pending = self.pending
+        if pending is None:
+            pending = self.pending = deque()
+        room = max_pending - len(pending)
+        if len(items) <= room:
+            pending.extend(items)
+            return []
+        if overflow == 'block':
+            pending.extend(items[:room])
+            return items[room:]
+        if overflow == 'drop-new':
+            pending.extend(items[:room])
+            self.dropped += len(items) - room
+            return []
+        # drop-oldest: keep only the newest max_pending items
+        pending.extend(items)
+        for _ in range(len(pending) - max_pending):
+            pending.popleft()
+            self.dropped += 1
+        return []
+
+    def has_room(self, max_pending: int) -> bool:
+        return self.pending is None or len(self.pending) < max_pending
+
+    def notify(self, batch):
+        '''call a synchronous observer for each (topic, event); a failing call only loses its own event'''
+        target = self.ref()
+        if target is None:
+            return
+        function = self.function
+        for topic, event in batch:
+            try:
+                if function is None:
+                    target(topic, event)
+                else:
+                    function(target, topic, event)
+            except Exception:
+                logger.exception("observer %r failed on %r event %r", target, topic, event)
+
+    async def notify_async(self, batch):
+        '''like notify(), awaiting a coroutine observer one event at a time'''
+        target = self.ref()
+        if target is None:
+            return
+        function = self.function
+        for topic, event in batch:
+            try:
+                # each coroutine is only created once the previous one has finished
+                result = target(topic, event) if function is None else function(target, topic, event)
+                if self.is_coroutine:
+                    await result
+            except Exception:
+                logger.exception("observer %r failed on %r event %r", target, topic, event)
+
+
+def _split(observer):
+    '''return the object to hold weakly and the function to call it through'''
+    if isinstance(observer, Observer):
+        return observer, type(observer).update
+    if inspect.ismethod(observer):
+        # a bound method is recreated on every attribute access, so hold its instance instead
+        return observer.__self__, observer.__func__
+    return observer, None
+
+
+'''
+the subject: observers subscribe to topics and publishers publish events on a topic.
+Observers are held through weak references, so subscribing never keeps an observer alive;
+keep your own reference to it (a lambda passed directly is collected at once).
+Subscriptions are indexed by topic, so a publish only visits the observers of that topic.
+This bus delivers synchronously: publish() returns once every observer has run,
+and an exception raised by an observer propagates to the publisher.
+'''
+class EventBus:
+    accepts_coroutines = False
+
+    def __init__(self):
+        # topic -> {(id(target), function): _Subscription}, changed under the lock
+        self._subscriptions = {}
+        # topic -> tuple of its subscriptions, rebuilt lazily after a change, read without locking
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: str, observer: Union[Observer, Callable[[str, Any], Any]]):
+        '''subscribe an Observer, or a callable taking (topic, event), to topic; subscribing twice has no effect'''
+        target, function = _split(observer)
+        subscription = _Subscription(target, function)
+        if subscription.is_coroutine and not self.accepts_coroutines:
+            raise TypeError(f"{type(self).__name__} cannot await coroutine observers, use AsyncEventBus")
+        with self._lock:
+            topic_subscriptions = self._subscriptions.setdefault(topic, {})
+            key = (id(target), function)
+            current = topic_subscriptions.get(key)
+            # the key of a collected observer can be reused by a new object
+            if current is None or current.ref() is not target:
+                topic_subscriptions[key] = subscription
+                self._snapshots.pop(topic, None)
+
+    def unsubscribe(self, topic: str, observer: Union[Observer, Callable[[str, Any], Any]]):
+        target, function = _split(observer)
+        with self._lock:
+            topic_subscriptions = self._subscriptions.get(topic, {})
+            if topic_subscriptions.pop((id(target), function), None) is not None:
+                self._snapshots.pop(topic, None)
+                if not topic_subscriptions:
+                    del self._subscriptions[topic]
+
+    def subscriber_count(self, topic: str) -> int:
+        return sum(1 for subscription in self._snapshot(topic) if subscription.ref() is not None)
+
+    def publish(self, topic: str, event: Any) -> int:
+        '''notify every observer of topic; return the number of observers notified'''
+        subscriptions = self._snapshots.get(topic)
+        if subscriptions is None:
+            subscriptions = self._snapshot(topic)
+        dead = 0
+        for subscription in subscriptions:
+            target = subscription.ref()
+            if target is None:
+                dead += 1
+            elif subscription.function is None:
+                target(topic, event)
+            else:
+                subscription.function(target, topic, event)
+        if dead:
+            self._prune(topic)
+        return len(subscriptions) - dead
+
+    def publish_many(self, topic: str, events: Iterable[Any]) -> int:
+        '''notify every observer of topic of each event in turn; the topic is looked up and each weak reference resolved once per batch'''
+        events = list(events)
+        subscriptions = self._snapshots.get(topic)
+        if subscriptions is None:
+            subscriptions = self._snapshot(topic)
+        dead = 0
+        for subscription in subscriptions:
+            target = subscription.ref()
+            if target is None:
+                dead += 1
+                continue
+            function = subscription.function
+            if function is None:
+                for event in events:
+                    target(topic, event)
+            else:
+                for event in events:
+                    function(target, topic, event)
+        if dead:
+            self._prune(topic)
+        return len(subscriptions) - dead
+
+    def _snapshot(self, topic: str) -> tuple:
+        with self._lock:
+            topic_subscriptions = self._subscriptions.get(topic)
+            if topic_subscriptions is None:
+                # not cached, so publishing to many unknown topics does not grow the index
+                return ()
+            subscriptions = self._snapshots[topic] = tuple(topic_subscriptions.values())
+            return subscriptions
+
+    def _prune(self, topic: str):
+        '''drop the subscriptions of collected observers, found while publishing'''
+        with self._lock:
+            topic_subscriptions = self._subscriptions.get(topic, {})
+            for key, subscription in list(topic_subscriptions.items()):
+                if subscription.ref() is None:
+                    del topic_subscriptions[key]
+            self._snapshots.pop(topic, None)
+            if not topic_subscriptions:
+                self._subscriptions.pop(topic, None)
+
+
+'''
+delivers on a thread pool through a bounded mailbox per subscription, so a slow observer
+delays neither the publisher nor the other observers. Each observer still sees its events
+in publish order, and at most one worker drains a given mailbox at a time.
+When a mailbox holds max_pending events the overflow policy applies:
+'block' makes the publisher wait for room, 'drop-oldest' and 'drop-new' discard events.
+With 'block', an observer must not publish to a topic it is itself subscribed to.
+Every publish hands idle mailboxes to the pool, so publish_many() amortizes that over a batch.
+'''
+class ThreadedEventBus(EventBus):
+    OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-new')
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: int = 1024, overflow: str = 'block'):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy: {overflow}")
+        super().__init__()
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self._executor = ThreadPoolExecutor(max_workers)
+        # guards every mailbox; workers signal it when they take a batch or go idle
+        self._condition = threading.Condition()
+        self._active = 0
+        # threads waiting on the condition, so idle workers skip waking anyone
+        self._waiting = 0
+
+    def publish(self, topic: str, event: Any) -> int:
+        return self.publish_many(topic, (event,))
+
+    def publish_many(self, topic: str, events: Iterable[Any]) -> int:
+        '''queue the events for every observer of topic; return the number of observers they were queued for'''
+        items = [(topic, event) for event in events]
+        subscriptions = self._snapshots.get(topic)
+        if subscriptions is None:
+            subscriptions = self._snapshot(topic)
+        delivered = 0
+        dead = 0
+        with self._condition:
+            for subscription in subscriptions:
+                if subscription.ref() is None:
+                    dead += 1
+                    continue
+                waiting = subscription.offer(items, self.max_pending, self.overflow)
+                while waiting:
+                    self._schedule(subscription)
+                    self._wait_for(lambda: subscription.has_room(self.max_pending))
+                    waiting = subscription.offer(waiting, self.max_pending, self.overflow)
+                self._schedule(subscription)
+                delivered += 1
+        if dead:
+            self._prune(topic)
+        return delivered
+
+    def dropped_events(self, topic: str) -> int:
+        return sum(subscription.dropped for subscription in self._snapshot(topic))
+
+    def join(self):
+        '''wait until every queued event has been delivered'''
+        with self._condition:
+            self._wait_for(lambda: not self._active)
+
+    def close(self):
+        self.join()
+        self._executor.shutdown()
+
+    def _wait_for(self, predicate):
+        # called with the condition held
+        self._waiting += 1
+        try:
+            self._condition.wait_for(predicate)
+        finally:
+            self._waiting -= 1
+
+    def _schedule(self, subscription: _Subscription):
+        # called with the condition held
+        if not subscription.scheduled and subscription.pending:
+            subscription.scheduled = True
+            self._active += 1
+            self._executor.submit(self._drain, subscription)
+
+    def _drain(self, subscription: _Subscription):
+        while True:
+            with self._condition:
+                # take the whole mailbox at once; publishers refill a fresh one meanwhile
+                batch = subscription.pending
+                subscription.pending = None
+                if not batch:
+                    subscription.scheduled = False
+                    self._active -= 1
+                if self._waiting:
+                    self._condition.notify_all()
+                if not batch:
+                    return
+            subscription.notify(batch)
+
+
+'''
+delivers on the running asyncio event loop through a bounded mailbox per subscription.
+Observers may be coroutine functions, which are awaited in order. publish() and
+publish_many() are coroutines: with the 'block' overflow policy they wait for room.
+'''
+class AsyncEventBus(EventBus):
+    OVERFLOW_POLICIES = ThreadedEventBus.OVERFLOW_POLICIES
+    accepts_coroutines = True
+
+    def __init__(self, max_pending: int = 1024, overflow: str = 'block'):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy: {overflow}")
+        super().__init__()
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self._space = asyncio.Condition()
+        self._active = 0
+        # strong references to the drain tasks, which the event loop only holds weakly
+        self._tasks = set()
+
+    async def publish(self, topic: str, event: Any) -> int:
+        return await self.publish_many(topic, (event,))
+
+    async def publish_many(self, topic: str, events: Iterable[Any]) -> int:
+        items = [(topic, event) for event in events]
+        subscriptions = self._snapshots.get(topic)
+        if subscriptions is None:
+            subscriptions = self._snapshot(topic)
+        delivered = 0
+        dead = 0
+        for subscription in subscriptions:
+            if subscription.ref() is None:
+                dead += 1
+                continue
+            waiting = subscription.offer(items, self.max_pending, self.overflow)
+            while waiting:
+                self._schedule(subscription)
+                async with self._space:
+                    await self._space.wait_for(lambda: subscription.has_room(self.max_pending))
+                waiting = subscription.offer(waiting, self.max_pending, self.overflow)
+            self._schedule(subscription)
+            delivered += 1
+        if dead:
+            self._prune(topic)
+        return delivered
+
+    def dropped_events(self, topic: str) -> int:
+        return sum(subscription.dropped for subscription in self._snapshot(topic))
+
+    async def join(self):
+        '''wait until every queued event has been delivered'''
+        async with self._space:
+            await self._space.wait_for(lambda: not self._active)
+
+    def _schedule(self, subscription: _Subscription):
+        if not subscription.scheduled and subscription.pending:
+            subscription.scheduled = True
+            self._active += 1
+            task = asyncio.get_running_loop().create_task(self._drain(subscription))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, subscription: _Subscription):
+        try:
+            while subscription.pending:
+                batch = subscription.pending
+                subscription.pending = None
+                async with self._space:
+                    self._space.notify_all()
+                await subscription.notify_async(batch)
+        finally:
+            subscription.scheduled = False
+            self._active -= 1
+            async with self._space:
+                self._space.notify_all()
+
+
+############################################################################
+# Benchmark
+############################################################################
+
+
+class _Counter(Observer):
+    def __init__(self):
+        self.count = 0
+
+    def update(self, topic, event):
+        self.count += 1
+
+
+'''the textbook subject: one list of (topic, observer) pairs, scanned on every notify'''
+class _NaiveSubject:
+    def __init__(self):
+        self._observers = []
+
+    def attach(self, topic, observer):
+        self._observers.append((topic, observer))
+
+    def notify(self, topic, event):
+        for observer_topic, observer in self._observers:
+            if observer_topic == topic:
+                observer.update(topic, event)
+
+
+def benchmark_event_bus(subscriber_counts=(1, 1_000, 100_000), deliveries=300_000, batch_size=100):
+    '''events/sec and deliveries/sec of each delivery mode, publishing one event at a time and in batches'''
+    for n_subscribers in subscriber_counts:
+        observers = [_Counter() for _ in range(n_subscribers)]
+        n_events = max(batch_size, deliveries // n_subscribers)
+        events = list(range(n_events))
+        batches = [events[i:i + batch_size] for i in range(0, n_events, batch_size)]
+
+        def run_sync(bus, batched):
+            if batched:
+                for batch in batches:
+                    bus.publish_many('orders', batch)
+            else:
+                for event in events:
+                    bus.publish('orders', event)
+
+        def run_threaded(bus, batched):
+            run_sync(bus, batched)
+            bus.join()
+
+        def run_async(bus, batched):
+            async def publish_all():
+                if batched:
+                    for batch in batches:
+                        await bus.publish_many('orders', batch)
+                else:
+                    for event in events:
+                        await bus.publish('orders', event)
+                await bus.join()
+            asyncio.run(publish_all())
+
+        modes = {
+            'sync': (EventBus, run_sync),
+            'threads': (lambda: ThreadedEventBus(max_pending=n_events), run_threaded),
+            'asyncio': (lambda: AsyncEventBus(max_pending=n_events), run_async),
+        }
+        for label, (make_bus, run) in modes.items():
+            for batched in (False, True):
+                bus = make_bus()
+                for observer in observers:
+                    bus.subscribe('orders', observer)
+                start = time.perf_counter()
+                run(bus, batched)
+                elapsed = time.perf_counter() - start
+                if isinstance(bus, ThreadedEventBus):
+                    bus.close()
+                publish = 'publish_many' if batched else 'publish'
+                print(f"{n_subscribers:>7} subscribers, {label:>7} {publish:>12}: "
+                      f"{n_events / elapsed:12,.0f} events/sec, {n_events * n_subscribers / elapsed:14,.0f} deliveries/sec")
+        assert all(observer.count == 6 * n_events for observer in observers)
+
+
+def benchmark_topic_dispatch(n_subscribers=100_000, n_topics=1_000, n_events=1_000):
+    '''compare a subject scanning every observer against the topic-indexed bus, with observers spread over many topics'''
+    observers = [_Counter() for _ in range(n_subscribers)]
+    naive = _NaiveSubject()
+    bus = EventBus()
+    for i, observer in enumerate(observers):
+        naive.attach(f"topic {i % n_topics}", observer)
+        bus.subscribe(f"topic {i % n_topics}", observer)
+    for label, publish in (('naive scan', naive.notify), ('topic index', bus.publish)):
+        start = time.perf_counter()
+        for event in range(n_events):
+            publish(f"topic {event % n_topics}", event)
+        elapsed = time.perf_counter() - start
+        print(f"{n_subscribers} subscribers on {n_topics} topics, {label:>11}: {n_events / elapsed:12,.0f} events/sec")
+
+
+############################################################################
+# Usage
+############################################################################
+
+
+'''concrete observers'''
+class EmailNotifier(Observer):
+    def update(self, topic, event):
+        print(f"<EmailNotifier> {topic}: emailing {event['customer']} about order {event['order_id']}")
+
+
+class InventoryUpdater(Observer):
+    def update(self, topic, event):
+        print(f"<InventoryUpdater> {topic}: reserving {', '.join(event['items'])}")
+
+
+def main():
+    bus = EventBus()
+    email_notifier = EmailNotifier()
+    inventory_updater = InventoryUpdater()
+
+    bus.subscribe('order.created', email_notifier)
+    bus.subscribe('order.created', inventory_updater)
+    bus.subscribe('order.shipped', email_notifier)
+
+    bus.publish('order.created', {'order_id': 1, 'customer': 'jane@example.com', 'items': ['Item 1', 'Item 2']})
+    bus.publish('order.shipped', {'order_id': 1, 'customer': 'jane@example.com', 'items': ['Item 1', 'Item 2']})
+
+    # observers are held weakly: once the last reference is gone, it is no longer notified
+    del inventory_updater
+    print("observers of order.created:", bus.subscriber_count('order.created'))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,18 @@
 from abc import ABC, abstractmethod
+from array import array
+import copy
+import time
+import tracemalloc
+from typing import Iterable, List
+
+try:
+    import numpy as np
+except ImportError:  # batch discounts fall back to pure Python
+    np = None
+
+
+def _is_ndarray(totals) -> bool:
+    return np is not None and isinstance(totals, np.ndarray)
 
 
 class DiscountStrategy(ABC):
@@ -7,11 +21,30 @@ class DiscountStrategy(ABC):
     def apply_discount(self, total: float) -> float:
         pass
 
+    def apply_discount_batch(self, totals):
+        '''apply the discount to many totals: a NumPy array gives a NumPy array, anything else an array('d')'''
+        if _is_ndarray(totals):
+            return np.fromiter(map(self.apply_discount, totals), dtype=float, count=len(totals))
+        return array('d', map(self.apply_discount, totals))
+
+    def _emit(self, code: '_PipelineCode', value: str) -> str:
+        '''emit straight-line code applying this discount to `value`; return the result variable'''
+        # strategies without an inlined form are called through their own apply_discount
+        return code.assign(f"{code.constant(self)}.apply_discount({value})")
+
 
 class NoDiscount(DiscountStrategy):
     def apply_discount(self, total: float) -> float:
         return total
 
+    def apply_discount_batch(self, totals):
+        if _is_ndarray(totals):
+            return totals.astype(float)
+        return array('d', totals)
+
+    def _emit(self, code, value):
+        return value
+
 
 class PercentageDiscount(DiscountStrategy):
     def __init__(self, percentage: float):
@@ -20,6 +53,15 @@ class PercentageDiscount(DiscountStrategy):
     def apply_discount(self, total: float) -> float:
         return total * (1 - self.percentage / 100)
 
+    def apply_discount_batch(self, totals):
+        factor = 1 - self.percentage / 100
+        if _is_ndarray(totals):
+            return totals * factor
+        return array('d', map(factor.__mul__, totals))
+
+    def _emit(self, code, value):
+        return code.assign(f"{value} * {code.constant(1 - self.percentage / 100)}")
+
 
 class FixedAmountDiscount(DiscountStrategy):
     def __init__(self, fixed_amount: float):
@@ -28,33 +70,323 @@ class FixedAmountDiscount(DiscountStrategy):
     def apply_discount(self, total: float) -> float:
         return max(0, total - self.fixed_amount)
 
+    def apply_discount_batch(self, totals):
+        fixed_amount = self.fixed_amount
+        if _is_ndarray(totals):
+            return np.maximum(totals - fixed_amount, 0.0)
+        return array('d', [total - fixed_amount if total > fixed_amount else 0.0 for total in totals])
+
+    def _emit(self, code, value):
+        # same result as max(0, ...) without the builtin call
+        reduced = code.assign(f"{value} - {code.constant(self.fixed_amount)}")
+        return code.assign(f"{reduced} if {reduced} > 0 else 0")
+
+
+'''collects the straight-line source of a compiled discount pipeline'''
+class _PipelineCode:
+    def __init__(self):
+        self.lines = []
+        self.namespace = {}
+
+    def constant(self, value) -> str:
+        name = f"c{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def assign(self, expression: str) -> str:
+        name = f"v{len(self.lines)}"
+        self.lines.append(f"    {name} = {expression}")
+        return name
+
+    def build(self, strategy: DiscountStrategy):
+        result = strategy._emit(self, 'total')
+        source = "def apply_discount(total):\n" + "\n".join(self.lines + [f"    return {result}"])
+        exec(source, self.namespace)
+        return self.namespace['apply_discount']
+
+
+'''
+base class for discount pipelines: the whole pipeline is compiled into one flat function
+when it is built, so stacked promotions avoid a virtual call per stage.
+The pipeline keeps its own copies of the stages, taken at build time, so changing a stage
+afterwards affects neither apply_discount, apply_discount_batch nor a pickled copy;
+build a new pipeline to change a promotion.
+'''
+class CompositeDiscount(DiscountStrategy):
+    def __init__(self, *strategies: DiscountStrategy):
+        if not strategies:
+            raise ValueError("A composite discount needs at least one strategy")
+        self.strategies = tuple(copy.deepcopy(strategy) for strategy in strategies)
+        self._compile()
+
+    def apply_discount(self, total: float) -> float:
+        # only reached before __init__ has compiled the pipeline
+        raise RuntimeError("CompositeDiscount.__init__ was not called")
+
+    def _compile(self):
+        self._compiled = _PipelineCode().build(self)
+        # shadow the method with the compiled function, so a call costs a single function call
+        self.apply_discount = self._compiled
+
+    def __getstate__(self):
+        # generated functions cannot be pickled; __setstate__ compiles the pipeline again
+        state = self.__dict__.copy()
+        del state['_compiled'], state['apply_discount']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+
+'''apply each strategy in turn, e.g. a percentage discount then a fixed discount'''
+class ChainedDiscount(CompositeDiscount):
+    def apply_discount_batch(self, totals):
+        for strategy in self.strategies:
+            totals = strategy.apply_discount_batch(totals)
+        return totals
+
+    def _emit(self, code, value):
+        for strategy in self.strategies:
+            value = strategy._emit(code, value)
+        return value
+
+
+'''apply whichever strategy gives the customer the lowest total'''
+class BestOfDiscount(CompositeDiscount):
+    def apply_discount_batch(self, totals):
+        results = [strategy.apply_discount_batch(totals) for strategy in self.strategies]
+        if len(results) == 1:
+            return results[0]
+        if _is_ndarray(totals):
+            return np.minimum.reduce(results)
+        return array('d', map(min, *results))
+
+    def _emit(self, code, value):
+        if len(self.strategies) == 1:
+            return self.strategies[0]._emit(code, value)
+        candidates = [strategy._emit(code, value) for strategy in self.strategies]
+        return code.assign(f"min({', '.join(candidates)})")
+
 
 class ShoppingCart:
 
     def __init__(self, discount_strategy):
         '''initialize the shopping cart with the given discount_strategy and an empty items dictionary'''
-        self.discount_strategy = discount_strategy
         self.shopping_cart = {}
+        # running total kept with Neumaier compensated summation, so adds and removes do not drift
+        self._total = 0.0
+        self._compensation = 0.0
+        self.discount_strategy = discount_strategy
 
     def add_item(self, item: str, price: float):
         '''add the item with its price to the items dictionary'''
         if item not in self.shopping_cart:
             self.shopping_cart[item] = 0
+        previous = self.shopping_cart[item]
         self.shopping_cart[item] += price
+        # account for the stored line value exactly, so removing the item later cancels it out
+        self._accumulate(self.shopping_cart[item])
+        self._accumulate(-previous)
 
     def remove_item(self, item: str):
         '''remove the item from the items dictionary if it exists'''
         if item in self.shopping_cart:
-            del self.shopping_cart[item]
+            self._accumulate(-self.shopping_cart.pop(item))
 
     def get_total(self) -> float:
-        '''calculate and return the total price of the items in the cart'''
-        return sum(self.shopping_cart.values())
+        '''return the total price of the items in the cart, maintained as items are added and removed'''
+        return self._total + self._compensation
 
     def get_total_after_discount(self) -> float:
-        '''calculate and return the total price of the items in the cart after applying the discount'''
-        total = self.get_total()
-        return self.discount_strategy.apply_discount(total)
+        '''return the total price of the items in the cart after applying the discount'''
+        # not cached: with the running total this is O(1), and the strategy may be changed in place
+        return self.discount_strategy.apply_discount(self.get_total())
+
+    def _accumulate(self, value: float):
+        total = self._total + value
+        # keep the low-order bits lost by the addition
+        if abs(self._total) >= abs(value):
+            self._compensation += (self._total - total) + value
+        else:
+            self._compensation += (value - total) + self._total
+        self._total = total
+
+
+'''
+many carts in columnar form: one row per (cart, item, price) line.
+Totals for every cart are computed in one grouped pass, and each group of carts
+sharing a DiscountStrategy is priced with a single apply_discount_batch call.
+Results are NumPy arrays when NumPy is installed, array('d') otherwise.
+'''
+class CartStore:
+    def __init__(self):
+        self._cart_ids = array('q')
+        self._item_ids = array('q')
+        self._prices = array('d')
+        self._strategies: List[DiscountStrategy] = []
+        self._item_index = {}
+
+    def new_cart(self, discount_strategy: DiscountStrategy) -> int:
+        '''add an empty cart and return its id'''
+        self._strategies.append(discount_strategy)
+        return len(self._strategies) - 1
+
+    def set_discount_strategy(self, cart_id: int, discount_strategy: DiscountStrategy):
+        self._strategies[cart_id] = discount_strategy
+
+    def add_items(self, cart_ids: Iterable[int], items: Iterable[str], prices: Iterable[float]):
+        '''append one line per (cart id, item, price)'''
+        item_index = self._item_index
+        for cart_id, item, price in zip(cart_ids, items, prices):
+            if not 0 <= cart_id < len(self._strategies):
+                raise KeyError(f"Unknown cart id: {cart_id}")
+            self._cart_ids.append(cart_id)
+            self._item_ids.append(item_index.setdefault(item, len(item_index)))
+            self._prices.append(price)
+
+    def remove_items(self, cart_ids: Iterable[int], items: Iterable[str]):
+        '''remove every line of the given items from the given carts, in one compacting pass'''
+        removed = {(cart_id, self._item_index[item]) for cart_id, item in zip(cart_ids, items)
+                   if item in self._item_index}
+        if not removed:
+            return
+        keep = [i for i, key in enumerate(zip(self._cart_ids, self._item_ids)) if key not in removed]
+        self._cart_ids = array('q', [self._cart_ids[i] for i in keep])
+        self._item_ids = array('q', [self._item_ids[i] for i in keep])
+        self._prices = array('d', [self._prices[i] for i in keep])
+
+    def get_totals(self):
+        '''total price of every cart, indexed by cart id'''
+        n_carts = len(self._strategies)
+        if np is not None:
+            return np.bincount(np.frombuffer(self._cart_ids, dtype=np.int64),
+                               weights=np.frombuffer(self._prices, dtype=float), minlength=n_carts)
+        totals = array('d', bytes(8 * n_carts))
+        for cart_id, price in zip(self._cart_ids, self._prices):
+            totals[cart_id] += price
+        return totals
+
+    def get_totals_after_discount(self):
+        '''discounted total of every cart, indexed by cart id'''
+        totals = self.get_totals()
+        groups = {}
+        for cart_id, strategy in enumerate(self._strategies):
+            groups.setdefault(id(strategy), (strategy, []))[1].append(cart_id)
+        discounted = totals.copy() if np is not None else array('d', totals)
+        for strategy, cart_ids in groups.values():
+            if np is not None:
+                index = np.array(cart_ids, dtype=np.int64)
+                discounted[index] = strategy.apply_discount_batch(totals[index])
+            else:
+                group_totals = strategy.apply_discount_batch(array('d', [totals[i] for i in cart_ids]))
+                for cart_id, total in zip(cart_ids, group_totals):
+                    discounted[cart_id] = total
+        return discounted
+
+    def __len__(self):
+        return len(self._strategies)
+
+
+def benchmark_batch_discounts(sizes=(10**3, 10**6, 10**7)):
+    '''compare per-call apply_discount against apply_discount_batch on array('d') and, if available, NumPy input'''
+    strategies = [NoDiscount(), PercentageDiscount(10), FixedAmountDiscount(5)]
+    for size in sizes:
+        totals = array('d', (float(i % 100) for i in range(size)))
+        inputs = {"array('d')": totals}
+        if np is not None:
+            inputs['numpy'] = np.frombuffer(totals, dtype=float)
+        for strategy in strategies:
+            name = type(strategy).__name__
+            start = time.perf_counter()
+            [strategy.apply_discount(total) for total in totals]
+            elapsed = time.perf_counter() - start
+            print(f"{size:>9} carts, {name:>19}, per call: {size / elapsed:14,.0f} carts/sec")
+            for label, batch in inputs.items():
+                start = time.perf_counter()
+                strategy.apply_discount_batch(batch)
+                elapsed = time.perf_counter() - start
+                print(f"{size:>9} carts, {name:>19}, batch {label:>10}: {size / elapsed:14,.0f} carts/sec")
+
+
+def benchmark_stacked_discounts(n_carts=1_000_000, max_stages=4):
+    '''compare a single strategy, per-stage Python calls and a compiled ChainedDiscount as stages are stacked'''
+    totals = [float(i % 100) for i in range(n_carts)]
+    single = PercentageDiscount(10)
+    start = time.perf_counter()
+    for total in totals:
+        single.apply_discount(total)
+    print(f"single strategy: {n_carts / (time.perf_counter() - start):14,.0f} carts/sec")
+    for n_stages in range(2, max_stages + 1):
+        stages = [PercentageDiscount(10) if i % 2 == 0 else FixedAmountDiscount(1) for i in range(n_stages)]
+        start = time.perf_counter()
+        for total in totals:
+            for stage in stages:
+                total = stage.apply_discount(total)
+        chained_calls = n_carts / (time.perf_counter() - start)
+        pipeline = ChainedDiscount(*stages)
+        start = time.perf_counter()
+        for total in totals:
+            pipeline.apply_discount(total)
+        compiled = n_carts / (time.perf_counter() - start)
+        print(f"{n_stages} stages: per-stage calls {chained_calls:14,.0f} carts/sec, compiled {compiled:14,.0f} carts/sec")
+
+
+def benchmark_running_totals(n_lines=5000):
+    '''compare recomputing the total after every change against the running total'''
+    cart = ShoppingCart(PercentageDiscount(10))
+    recompute = 0.0
+    running = 0.0
+    for i in range(n_lines):
+        cart.add_item(f"Item {i}", 0.1)
+        start = time.perf_counter()
+        sum(cart.shopping_cart.values())
+        recompute += time.perf_counter() - start
+        start = time.perf_counter()
+        cart.get_total_after_discount()
+        running += time.perf_counter() - start
+    print(f"{n_lines} lines: recompute {recompute / n_lines * 1e6:8.2f} us/total, "
+          f"running {running / n_lines * 1e6:8.2f} us/total")
+    print(f"naive sum {sum(cart.shopping_cart.values())!r}, running total {cart.get_total()!r}")
+
+
+def benchmark_cart_store(n_carts=100_000, lines_per_cart=10):
+    '''compare throughput and memory of a CartStore against a list of ShoppingCart objects'''
+    strategies = [NoDiscount(), PercentageDiscount(10), FixedAmountDiscount(5)]
+    items = [f"Item {i}" for i in range(lines_per_cart)]
+
+    def build_carts():
+        carts = []
+        for cart_id in range(n_carts):
+            cart = ShoppingCart(strategies[cart_id % 3])
+            for line, item in enumerate(items):
+                cart.add_item(item, float(line + 1))
+            carts.append(cart)
+        return carts
+
+    def build_store():
+        store = CartStore()
+        for cart_id in range(n_carts):
+            store.new_cart(strategies[cart_id % 3])
+        store.add_items((cart_id for cart_id in range(n_carts) for _ in items),
+                        items * n_carts,
+                        [float(line + 1) for line in range(lines_per_cart)] * n_carts)
+        return store
+
+    layouts = {
+        'ShoppingCart list': (build_carts, lambda carts: [cart.get_total_after_discount() for cart in carts]),
+        'CartStore': (build_store, lambda store: store.get_totals_after_discount()),
+    }
+    for label, (build, price) in layouts.items():
+        tracemalloc.start()
+        container = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        start = time.perf_counter()
+        price(container)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>17}: {n_carts / elapsed:12,.0f} carts/sec, {size / n_carts:8.1f} bytes/cart")
+        del container
 
 
 if __name__ == "__main__":
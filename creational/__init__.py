@@ -0,0 +1,61 @@
+'''creational design patterns; each submodule is imported only when one of its names is first used'''
+import importlib
+
+# public name -> submodule defining it; submodules are imported on first access
+_EXPORTS = {
+    "ClassicSingleton": "singleton_pattern",
+    "SimpleSingleton": "singleton_pattern",
+    "MetaSingletonLazy": "singleton_pattern",
+    "ConcreteMetaSingletonLazy": "singleton_pattern",
+    "MetaSingletonEager": "singleton_pattern",
+    "ThreadSafeSingleton": "singleton_pattern",
+    "MetaThreadSafeSingleton": "singleton_pattern",
+    "ConcreteMetaThreadSafeSingleton": "singleton_pattern",
+    "enable_fork_safety": "singleton_pattern",
+    "SingletonMeta": "singleton_logger",
+    "SingletonABCMeta": "singleton_logger",
+    "BaseLogger": "singleton_logger",
+    "MyLogger": "singleton_logger",
+    "RateLimit": "singleton_logger",
+    "BoundedQueueHandler": "singleton_logger",
+    "FileAuditManager": "singleton_FileAuditManager",
+    "SegmentedLog": "singleton_FileAuditManager",
+    "LockedAppendWriter": "singleton_FileAuditManager",
+    "CachedTimestampFormatter": "timestamp_formatter",
+    "CachedAsctimeFormatter": "timestamp_formatter",
+    "HotPathProfile": "timestamp_formatter",
+    "profile_handler": "timestamp_formatter",
+    "AnimalType": "simple_factory_pattern",
+    "Animal": "simple_factory_pattern",
+    "Dog": "simple_factory_pattern",
+    "Cat": "simple_factory_pattern",
+    "Fish": "simple_factory_pattern",
+    "AnimalFactory": "simple_factory_pattern",
+    "PooledAnimalFactory": "simple_factory_pattern",
+    "Sandwich": "builder_pattern",
+    "SandwichBuilder": "builder_pattern",
+    "VeggieSandwichBuilder": "builder_pattern",
+    "HamSandwichBuilder": "builder_pattern",
+    "SandwichDirector": "builder_pattern",
+    "SandwichTemplate": "builder_pattern",
+    "SandwichView": "builder_pattern",
+    "SandwichRenderer": "builder_pattern",
+    "TextCache": "builder_pattern",
+    "FrameStats": "builder_pattern",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    # cache it, so later lookups bypass __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
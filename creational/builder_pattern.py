@@ -1,5 +1,8 @@
-import pygame
+import os
 import sys
+import time
+import tracemalloc
+import weakref
 from abc import ABC, abstractmethod
 
 
@@ -7,9 +10,23 @@ from abc import ABC, abstractmethod
 class Sandwich:
     def __init__(self):
         self.ingredients = []
+        # bumped on every change, so views know when to redraw
+        self.version = 0
+
+    @classmethod
+    def from_ingredients(cls, ingredients):
+        '''a sandwich sharing an immutable ingredients tuple; it is copied on the first add_ingredient()'''
+        sandwich = cls.__new__(cls)
+        sandwich.ingredients = ingredients
+        sandwich.version = 0
+        return sandwich
 
     def add_ingredient(self, ingredient):
+        if isinstance(self.ingredients, tuple):
+            # copy-on-write for sandwiches stamped from a template
+            self.ingredients = list(self.ingredients)
         self.ingredients.append(ingredient)
+        self.version += 1
 
     def display(self):
         print("Sandwich with the following ingredients:")
@@ -58,10 +75,31 @@ class HamSandwichBuilder(SandwichBuilder):
         self.sandwich.add_ingredient("Mayonnaise")
 
 
+'''an immutable record of the ingredients one builder produces'''
+class SandwichTemplate:
+    def __init__(self, ingredients):
+        self.ingredients = tuple(ingredients)
+
+    def stamp(self, n):
+        '''create n sandwiches that all share this template's ingredients tuple'''
+        # inlined Sandwich.from_ingredients(), avoiding a call per product
+        ingredients = self.ingredients
+        new = Sandwich.__new__
+        products = []
+        for _ in range(n):
+            sandwich = new(Sandwich)
+            sandwich.ingredients = ingredients
+            sandwich.version = 0
+            products.append(sandwich)
+        return products
+
+
 '''the director class'''
 class SandwichDirector:
     def __init__(self, builder):
         self.builder = builder
+        # builder -> SandwichTemplate, recorded on first use
+        self._templates = weakref.WeakKeyDictionary()
 
     def build_sandwich(self):
         self.builder.create_new_sandwich()
@@ -69,47 +107,243 @@ class SandwichDirector:
         self.builder.add_filling()
         return self.builder.get_result()
 
+    def record_template(self, builder):
+        '''replay the builder's steps once and keep the result as a template'''
+        template = self._templates.get(builder)
+        if template is None:
+            previous, self.builder = self.builder, builder
+            try:
+                template = SandwichTemplate(self.build_sandwich().ingredients)
+            finally:
+                self.builder = previous
+            self._templates[builder] = template
+        return template
+
+    def build_many(self, builder, n):
+        '''build n identical sandwiches from the builder's recorded template'''
+        return self.record_template(builder).stamp(n)
+
+
+def _pygame():
+    '''import pygame on first use, so the builder classes can be imported without it'''
+    import pygame
+    return pygame
+
 
 def draw_text(screen, text, x, y, font, color):
     text_surface = font.render(text, True, color)
     screen.blit(text_surface, (x, y))
 
 
+'''renders each (text, color) pair once and reuses the surface'''
+class TextCache:
+    def __init__(self, font):
+        self.font = font
+        self._surfaces = {}
+
+    def get(self, text, color):
+        key = (text, color)
+        surface = self._surfaces.get(key)
+        if surface is None:
+            surface = self._surfaces[key] = self.font.render(text, True, color)
+        return surface
+
+
+'''draws one sandwich's title and ingredient list, only when the sandwich has changed'''
+class SandwichView:
+    def __init__(self, title, sandwich, x, y, width, line_height=30):
+        self.title = title
+        self.sandwich = sandwich
+        self.x = x
+        self.y = y
+        self.width = width
+        self.line_height = line_height
+        self._drawn_version = None
+
+    @property
+    def dirty(self):
+        return self._drawn_version != self.sandwich.version
+
+    def rect(self):
+        height = (len(self.sandwich.ingredients) + 1) * self.line_height + 10
+        return _pygame().Rect(self.x, self.y, self.width, height)
+
+    def draw(self, screen, texts, background, color):
+        area = self.rect()
+        screen.fill(background, area)
+        screen.blit(texts.get(self.title, color), (self.x, self.y))
+        for index, ingredient in enumerate(self.sandwich.ingredients):
+            screen.blit(texts.get(f"- {ingredient}", color), (self.x, self.y + (index + 1) * self.line_height))
+        self._drawn_version = self.sandwich.version
+        return area
+
+
+'''frame-time and CPU-usage counters for the render loop'''
+class FrameStats:
+    def __init__(self):
+        self.frames = 0
+        self.frame_seconds = 0.0
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def record(self, seconds):
+        self.frames += 1
+        self.frame_seconds += seconds
+
+    def report(self):
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        return {
+            'frames': self.frames,
+            'mean_frame_ms': self.frame_seconds / self.frames * 1000 if self.frames else 0.0,
+            'cpu_percent': cpu / wall * 100 if wall else 0.0,
+        }
+
+
+'''
+a render loop that blocks on events instead of polling, redraws only sandwiches
+that changed, and pushes only their dirty rects to the display
+'''
+class SandwichRenderer:
+    def __init__(self, screen, font, background=(255, 255, 255), color=(0, 0, 0)):
+        self.screen = screen
+        self.texts = TextCache(font)
+        self.background = background
+        self.color = color
+        self.views = []
+        self.stats = FrameStats()
+
+    def add(self, view):
+        self.views.append(view)
+
+    def render(self):
+        '''draw the dirty views and update only their rects; return the rects updated'''
+        start = time.perf_counter()
+        rects = [view.draw(self.screen, self.texts, self.background, self.color)
+                 for view in self.views if view.dirty]
+        if rects:
+            _pygame().display.update(rects)
+            self.stats.record(time.perf_counter() - start)
+        return rects
+
+    def redraw(self):
+        '''draw every view onto a cleared screen and flip the whole display'''
+        self.screen.fill(self.background)
+        for view in self.views:
+            view.draw(self.screen, self.texts, self.background, self.color)
+        _pygame().display.flip()
+
+    def run(self, timeout=None):
+        '''
+        handle events until the window closes; with a timeout (in ms), also wake up
+        periodically to pick up sandwiches changed outside the event loop
+        '''
+        pygame = _pygame()
+        # the window contents may be lost while it is covered or minimized, dirty or not;
+        # WINDOWEXPOSED and WINDOWRESTORED only exist in pygame 2
+        repaint_events = {getattr(pygame, name) for name in ('VIDEOEXPOSE', 'WINDOWEXPOSED', 'WINDOWRESTORED')
+                          if hasattr(pygame, name)}
+        self.redraw()
+        while True:
+            event = pygame.event.wait(timeout) if timeout else pygame.event.wait()
+            if event.type == pygame.QUIT:
+                return
+            if event.type in repaint_events:
+                self.redraw()
+            else:
+                self.render()
+
+
 ############################################################################
-# Usage
+# Benchmark
 ############################################################################
 
 
-# initialize Pygame
-pygame.init()
-screen = pygame.display.set_mode((600, 400))
-pygame.display.set_caption('Sandwich Builder')
-font = pygame.font.Font(pygame.font.get_default_font(), 18)
+def benchmark_rendering(n_sandwiches=200, n_frames=200):
+    '''headless (SDL dummy driver) comparison of the full-redraw loop against SandwichRenderer'''
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame = _pygame()
+    pygame.init()
+    screen = pygame.display.set_mode((1200, 800))
+    font = pygame.font.Font(pygame.font.get_default_font(), 12)
+    builders = [VeggieSandwichBuilder(), HamSandwichBuilder()]
+    sandwiches = [SandwichDirector(builders[i % 2]).build_sandwich() for i in range(n_sandwiches)]
+    columns = 10
+    positions = [((i % columns) * 120, (i // columns) * 130 % 800) for i in range(n_sandwiches)]
+
+    stats = FrameStats()
+    for _ in range(n_frames):
+        start = time.perf_counter()
+        screen.fill((255, 255, 255))
+        for sandwich, (x, y) in zip(sandwiches, positions):
+            draw_text(screen, "Sandwich:", x, y, font, (0, 0, 0))
+            for index, ingredient in enumerate(sandwich.ingredients):
+                draw_text(screen, f"- {ingredient}", x, y + 30 + index * 30, font, (0, 0, 0))
+        pygame.display.flip()
+        stats.record(time.perf_counter() - start)
+    print(f"full redraw: {stats.report()}")
+
+    renderer = SandwichRenderer(screen, font)
+    for sandwich, (x, y) in zip(sandwiches, positions):
+        renderer.add(SandwichView("Sandwich:", sandwich, x, y, 120))
+    for frame in range(n_frames):
+        # one sandwich changes per frame; the others stay cached and clean
+        sandwiches[frame % n_sandwiches].add_ingredient("Pickles")
+        renderer.render()
+    print(f"dirty rects: {renderer.stats.report()}")
+    pygame.quit()
+
+
+def benchmark_build_many(n_products=200_000):
+    '''compare products/sec and memory of per-build replay against build_many()'''
+    builder = HamSandwichBuilder()
+    director = SandwichDirector(builder)
+    variants = {
+        'replay': lambda: [director.build_sandwich() for _ in range(n_products)],
+        'build_many': lambda: director.build_many(builder, n_products),
+    }
+    for label, build in variants.items():
+        start = time.perf_counter()
+        build()
+        elapsed = time.perf_counter() - start
+        # memory is measured in a separate run, since tracing slows allocation down
+        tracemalloc.start()
+        products = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:>10}: {n_products / elapsed:12,.0f} products/sec, {size / n_products:8.1f} bytes/product")
+        del products
+
+
+############################################################################
+# Usage
+############################################################################
 
-# client code
-veggie_builder = VeggieSandwichBuilder()
-director = SandwichDirector(veggie_builder)
-veggie_sandwich = director.build_sandwich()
 
-ham_builder = HamSandwichBuilder()
-director.builder = ham_builder
-ham_sandwich = director.build_sandwich()
+def main():
+    # initialize Pygame
+    pygame = _pygame()
+    pygame.init()
+    screen = pygame.display.set_mode((600, 400))
+    pygame.display.set_caption('Sandwich Builder')
+    font = pygame.font.Font(pygame.font.get_default_font(), 18)
 
-while True:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
+    # client code
+    veggie_builder = VeggieSandwichBuilder()
+    director = SandwichDirector(veggie_builder)
+    veggie_sandwich = director.build_sandwich()
 
-    screen.fill((255, 255, 255))
+    ham_builder = HamSandwichBuilder()
+    director.builder = ham_builder
+    ham_sandwich = director.build_sandwich()
 
-    draw_text(screen, "Veggie Sandwich:", 10, 10, font, (0, 0, 0))
-    for index, ingredient in enumerate(veggie_sandwich.ingredients):
-        draw_text(screen, f"- {ingredient}", 10, 40 + index * 30, font, (0, 0, 0))
+    renderer = SandwichRenderer(screen, font)
+    renderer.add(SandwichView("Veggie Sandwich:", veggie_sandwich, 10, 10, 280))
+    renderer.add(SandwichView("Ham Sandwich:", ham_sandwich, 300, 10, 280))
+    renderer.run()
+    pygame.quit()
+    sys.exit()
 
-    draw_text(screen, "Ham Sandwich:", 300, 10, font, (0, 0, 0))
-    for index, ingredient in enumerate(ham_sandwich.ingredients):
-        draw_text(screen, f"- {ingredient}", 300, 40 + index * 30, font, (0, 0, 0))
 
-    pygame.display.flip()
-    pygame.time.delay(100)
+if __name__ == "__main__":
+    main()
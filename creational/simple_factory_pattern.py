@@ -1,5 +1,8 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from enum import Enum
+from typing import Iterable, List, Optional
+import time
 
 
 '''an enumeration for animal types'''
@@ -38,16 +41,168 @@ class Fish(Animal):
 
 '''an AnimalFactory class'''
 class AnimalFactory:
+    # animal type -> concrete Animal class, filled through register()
+    _registry: dict = {}
+
+    @classmethod
+    def register(cls, animal_type, animal_class=None):
+        '''register animal_class for animal_type; without animal_class, return a class decorator'''
+        if animal_class is None:
+            def decorator(animal_class):
+                cls._registry[animal_type] = animal_class
+                return animal_class
+            return decorator
+        cls._registry[animal_type] = animal_class
+        return animal_class
+
     def create_animal(self, animal_type: AnimalType, context: dict) -> Animal:
-        # Implement the logic to create an animal based on the animal_type parameter and context data
-        if animal_type == AnimalType.DOG:
-            return Dog(context["name"], context["age"])
-        elif animal_type == AnimalType.CAT:
-            return Cat(context["name"], context["age"])
-        elif animal_type == AnimalType.FISH:
-            return Fish(context["name"], context["age"])
-        else:
-            raise ValueError(f"Invalid animal type: {animal_type}")
+        # a single dict lookup, whatever the number of registered types
+        animal_class = self._animal_class(animal_type)
+        return animal_class(context["name"], context["age"])
+
+    def create_many(self, animal_type: AnimalType, contexts: Optional[Iterable[dict]] = None,
+                    names: Optional[Iterable[str]] = None, ages: Optional[Iterable[int]] = None) -> List[Animal]:
+        '''create many animals of one type from context dicts, or from columnar names and ages'''
+        # dispatch once for the whole batch
+        animal_class = self._animal_class(animal_type)
+        if contexts is not None:
+            return [animal_class(context["name"], context["age"]) for context in contexts]
+        return list(map(animal_class, names, ages))
+
+    def _animal_class(self, animal_type):
+        try:
+            return self._registry[animal_type]
+        except KeyError:
+            raise ValueError(f"Invalid animal type: {animal_type}") from None
+
+
+AnimalFactory.register(AnimalType.DOG, Dog)
+AnimalFactory.register(AnimalType.CAT, Cat)
+AnimalFactory.register(AnimalType.FISH, Fish)
+
+
+'''an AnimalFactory that recycles released animals and can share identical ones'''
+class PooledAnimalFactory(AnimalFactory):
+    def __init__(self, max_free_per_type: int = 1024, flyweight: bool = False, max_shared: int = 100_000):
+        # cap on idle animals kept per type
+        self.max_free_per_type = max_free_per_type
+        # share one instance per (type, name, age); shared animals must be treated as immutable
+        self.flyweight = flyweight
+        # cap on shared instances, the least recently used is forgotten first
+        self.max_shared = max_shared
+        self._free = {}
+        # identities of the animals on the free lists, so a double release is caught
+        self._free_ids = set()
+        self._shared = OrderedDict()
+        # concrete class -> animal type, looked up in the registry on first release
+        self._types = {}
+        self.allocations = 0
+        self.reuses = 0
+
+    def acquire(self, animal_type: AnimalType, context: dict) -> Animal:
+        if self.flyweight:
+            key = (animal_type, context["name"], context["age"])
+            animal = self._shared.get(key)
+            if animal is None:
+                animal = self._shared[key] = self._allocate(animal_type, context)
+                if len(self._shared) > self.max_shared:
+                    self._shared.popitem(last=False)
+            else:
+                self._shared.move_to_end(key)
+                self.reuses += 1
+            return animal
+        free = self._free.get(animal_type)
+        if free:
+            animal = free.pop()
+            self._free_ids.discard(id(animal))
+            animal.__init__(context["name"], context["age"])
+            self.reuses += 1
+            return animal
+        return self._allocate(animal_type, context)
+
+    def release(self, animal: Animal):
+        '''return an animal to its free list; shared flyweights are never pooled'''
+        if self.flyweight:
+            return
+        if id(animal) in self._free_ids:
+            raise ValueError(f"Animal released twice: {animal.get_info()}")
+        free = self._free.setdefault(self._animal_type(type(animal)), [])
+        if len(free) < self.max_free_per_type:
+            free.append(animal)
+            self._free_ids.add(id(animal))
+
+    def _allocate(self, animal_type: AnimalType, context: dict) -> Animal:
+        animal = self.create_animal(animal_type, context)
+        self.allocations += 1
+        return animal
+
+    def _animal_type(self, animal_class: type) -> AnimalType:
+        animal_type = self._types.get(animal_class)
+        if animal_type is None:
+            for registered_type, registered_class in self._registry.items():
+                if registered_class is animal_class:
+                    animal_type = self._types[animal_class] = registered_type
+                    break
+            else:
+                raise ValueError(f"Cannot pool unregistered animal class: {animal_class.__name__}")
+        return animal_type
+
+
+def benchmark_pooled_factory(n_objects=1_000_000):
+    '''compare objects/sec and allocation counts of the plain, pooled and flyweight factories'''
+    contexts = [{"name": f"Animal {i % 100}", "age": i % 10} for i in range(1000)]
+    animal_types = list(AnimalType)
+    plain = AnimalFactory()
+    factories = {
+        'plain': None,
+        'pooled': PooledAnimalFactory(),
+        'flyweight': PooledAnimalFactory(flyweight=True),
+    }
+    for label, factory in factories.items():
+        start = time.perf_counter()
+        for i in range(n_objects):
+            animal_type = animal_types[i % 3]
+            context = contexts[i % 1000]
+            if factory is None:
+                plain.create_animal(animal_type, context)
+            else:
+                factory.release(factory.acquire(animal_type, context))
+        elapsed = time.perf_counter() - start
+        allocations = n_objects if factory is None else factory.allocations
+        print(f"{label:>9}: {n_objects / elapsed:12,.0f} objects/sec, {allocations:,} allocations")
+
+
+def benchmark_factory_dispatch(n_objects=300_000, type_counts=(3, 300)):
+    '''compare if/elif-style linear dispatch, registry dispatch and create_many for 3 and 300 types'''
+    for n_types in type_counts:
+        kinds = Enum(f'Kinds{n_types}', [f'KIND_{i}' for i in range(n_types)])
+        factory = AnimalFactory()
+        chain = []
+        for kind in kinds:
+            animal_class = type(f'Animal{kind.value}', (Dog,), {})
+            factory.register(kind, animal_class)
+            chain.append((kind, animal_class))
+        # the last type is the worst case for the linear chain
+        kind = chain[-1][0]
+        context = {"name": "Buddy", "age": 3}
+
+        def linear_create(animal_type, context):
+            for candidate, animal_class in chain:
+                if animal_type == candidate:
+                    return animal_class(context["name"], context["age"])
+
+        variants = {
+            'linear chain': lambda: [linear_create(kind, context) for _ in range(n_objects)],
+            'registry': lambda: [factory.create_animal(kind, context) for _ in range(n_objects)],
+            'create_many': lambda: factory.create_many(kind, names=["Buddy"] * n_objects, ages=[3] * n_objects),
+        }
+        for label, create in variants.items():
+            start = time.perf_counter()
+            create()
+            elapsed = time.perf_counter() - start
+            print(f"{n_types:>3} types, {label:>12}: {n_objects / elapsed:12,.0f} objects/sec")
+        for candidate, _ in chain:
+            del AnimalFactory._registry[candidate]
 
 
 def main():
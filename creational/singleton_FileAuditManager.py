@@ -1,31 +1,496 @@
+import atexit
+import gzip
+import multiprocessing
+import os
+import queue
+import re
+import tempfile
 import threading
 import datetime
+import time
+import warnings
+from bisect import bisect_left
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+# rendered timestamps have a fixed width and sort chronologically as plain strings
+TIMESTAMP_LENGTH = 19
+
+
+"""
+Audit output split into numbered segments that rotate by size and/or age.
+Each segment has a sparse index of timestamp -> byte offset entries, so a time-range
+query seeks straight to the right segment and offset. Closed segments are gzip-compressed
+in a background thread, one gzip member per indexed block, so compressed segments can
+be seeked into as well.
+"""
+class SegmentedLog:
+
+    def __init__(self, base_name, max_bytes=None, interval=None, index_every_bytes=64 * 1024):
+        self.base_name = base_name
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.index_every_bytes = index_every_bytes
+        self._lock = threading.Lock()
+        # closed segment paths waiting to be compressed; None stops the compressor thread
+        self._pending = queue.Queue()
+        self._compressor = threading.Thread(target=self._compress_segments, name='SegmentedLog-compressor', daemon=True)
+        self._compressor.start()
+        self._sequence = max(self._sequences(), default=0)
+        self._closed = False
+        self._open_segment()
+
+    def write_lines(self, lines):
+        with self._lock:
+            for line in lines:
+                if self._size and self._rotation_due():
+                    self._rotate()
+                data = line.encode('utf-8')
+                if line[:1].isdigit() and (self._last_indexed is None
+                                           or self._size - self._last_indexed >= self.index_every_bytes):
+                    self._index_file.write(f"{line[:TIMESTAMP_LENGTH]}\t{self._size}\n".encode('utf-8'))
+                    self._last_indexed = self._size
+                self._file.write(data)
+                self._size += len(data)
+
+    def flush(self):
+        with self._lock:
+            if not self._closed:
+                self._file.flush()
+                self._index_file.flush()
+
+    def close(self):
+        # the active segment is compressed too; waits for every pending compression
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._close_segment()
+        self._pending.put(None)
+        self._compressor.join()
+
+    def query(self, start=None, end=None):
+        '''yield the lines whose timestamp lies within [start, end]'''
+        start_key = start.strftime(TIMESTAMP_FORMAT) if start else ''
+        end_key = end.strftime(TIMESTAMP_FORMAT) if end else '~'
+        self.flush()
+        segments = [(path, self._read_index(path)) for path in map(self._segment_path, self._sequences())]
+        for i, (path, index) in enumerate(segments):
+            if index and index[0][0] > end_key:
+                return
+            # every line of this segment predates the first line of the next one
+            following = next((later[0][0] for _, later in segments[i + 1:] if later), None)
+            if following is not None and following < start_key:
+                continue
+            for line in self._read_from(path, start_key):
+                if not line[:1].isdigit():
+                    continue
+                key = line[:TIMESTAMP_LENGTH]
+                if key > end_key:
+                    return
+                if key >= start_key:
+                    yield line
+
+    def _segment_path(self, sequence):
+        return f"{self.base_name}.{sequence:06d}"
+
+    def _sequences(self):
+        directory = os.path.dirname(self.base_name) or '.'
+        pattern = re.compile(re.escape(os.path.basename(self.base_name)) + r'\.(\d{6})(\.gz)?$')
+        matches = (pattern.match(name) for name in os.listdir(directory))
+        return sorted({int(match.group(1)) for match in matches if match})
+
+    def _open_segment(self):
+        self._sequence += 1
+        self._path = self._segment_path(self._sequence)
+        self._file = open(self._path, 'ab')
+        self._index_file = open(self._path + '.idx', 'ab')
+        self._size = 0
+        self._last_indexed = None
+        self._opened = time.monotonic()
+
+    def _close_segment(self):
+        self._file.close()
+        self._index_file.close()
+        self._pending.put(self._path)
+
+    def _rotation_due(self):
+        return ((self.max_bytes is not None and self._size >= self.max_bytes)
+                or (self.interval is not None and time.monotonic() - self._opened >= self.interval))
+
+    def _rotate(self):
+        self._close_segment()
+        self._open_segment()
+
+    @staticmethod
+    def _read_index(path):
+        # entries are (timestamp, raw offset, compressed offset or None)
+        try:
+            with open(path + '.idx', encoding='utf-8') as f:
+                rows = [line.rstrip('\n').split('\t') for line in f]
+        except FileNotFoundError:
+            return []
+        return [(row[0], int(row[1]), int(row[2]) if len(row) > 2 else None) for row in rows]
+
+    @classmethod
+    def _open_for_read(cls, path):
+        '''return (index, file, compressed) for a segment, with the index matching the form that was opened'''
+        index = cls._read_index(path)
+        if not index or index[0][2] is None:
+            try:
+                # once open, the raw segment stays readable even if the compressor removes it
+                return index, open(path, 'rb'), False
+            except FileNotFoundError:
+                # compressed since the index was read; the compressed index replaces the raw
+                # one before the raw segment is removed
+                index = cls._read_index(path)
+        return index, open(path + '.gz', 'rb'), True
+
+    @classmethod
+    def _read_from(cls, path, start_key):
+        # the lines of a segment from the last indexed block starting before start_key
+        index, f, compressed = cls._open_for_read(path)
+        with f:
+            position = bisect_left([entry[0] for entry in index], start_key) - 1
+            entry = index[position] if position >= 0 else None
+            if not compressed:
+                f.seek(entry[1] if entry else 0)
+                for line in f:
+                    yield line.decode('utf-8')
+                return
+            f.seek(entry[2] if entry else 0)
+            with gzip.GzipFile(fileobj=f) as lines:
+                for line in lines:
+                    yield line.decode('utf-8')
+
+    def _compress_segments(self):
+        for path in iter(self._pending.get, None):
+            self._compress(path)
+
+    @classmethod
+    def _compress(cls, path):
+        index = cls._read_index(path)
+        offsets = sorted({0} | {entry[1] for entry in index})
+        compressed = {}
+        with open(path, 'rb') as src, open(path + '.gz.tmp', 'wb') as dst:
+            # one gzip member per indexed block keeps every indexed offset seekable
+            for i, offset in enumerate(offsets):
+                end = offsets[i + 1] if i + 1 < len(offsets) else None
+                src.seek(offset)
+                data = src.read(end - offset if end is not None else -1)
+                compressed[offset] = dst.tell()
+                dst.write(gzip.compress(data))
+        with open(path + '.idx.tmp', 'w', encoding='utf-8') as f:
+            for key, offset, _ in index:
+                f.write(f"{key}\t{offset}\t{compressed[offset]}\n")
+        os.replace(path + '.gz.tmp', path + '.gz')
+        os.replace(path + '.idx.tmp', path + '.idx')
+        os.remove(path)
+
+'''appends each record with O_APPEND writes under an exclusive flock, so records from concurrent processes never interleave'''
+class LockedAppendWriter:
+    def __init__(self, file_name):
+        if fcntl is None:
+            raise RuntimeError('Process-safe audit logging needs fcntl, which this platform does not provide')
+        self.file_name = file_name
+        self._fd = self._open()
+
+    def _open(self):
+        return os.open(self.file_name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def write(self, text):
+        data = memoryview(text.encode('utf-8'))
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # a large record may take several writes; the lock keeps them contiguous
+            while data:
+                data = data[os.write(self._fd, data):]
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def flush(self):
+        # every write goes straight to the OS
+        pass
+
+    def reopen(self):
+        # a forked child shares the parent's open file description, and with it the flock; take a fresh one
+        os.close(self._fd)
+        self._fd = self._open()
+
+    def close(self):
+        os.close(self._fd)
 
 
 """
 This is a thread-safe Singleton class that writes log entries to a common file.
 Each log entry includes a timestamp and a message.
 The file name is configurable.
+In buffered mode, messages are queued and a background thread group-commits them
+in batches through a single open file handle.
+With max_segment_bytes or segment_interval set, output goes to rotating, compressed
+SegmentedLog segments that can be queried by time range.
+With process_safe set, records go through a LockedAppendWriter so that worker processes
+sharing the file never tear each other's records, and the instance repairs its locks,
+file handle and writer thread in forked children.
 """
 class FileAuditManager:
 
     _instance = None
     _lock = threading.Lock()
 
-    def __new__(cls, file_name='audit.log'):
+    def __new__(cls, file_name='audit.log', buffered=False, batch_size=512,
+                flush_interval=0.1, max_queue_size=10000,
+                max_segment_bytes=None, segment_interval=None, timestamps=None, profile=None,
+                process_safe=False):
+        segmented = max_segment_bytes is not None or segment_interval is not None
+        if process_safe and segmented:
+            raise ValueError('Segmented output cannot be shared between processes')
         with cls._lock:
             if cls._instance is None:
-                cls._instance = super(FileAuditManager, cls).__new__(cls)
-                cls._instance._file_name = file_name
-                with open(cls._instance._file_name, 'a') as file:
-                    file.write(f"Log started: {datetime.datetime.now()}\n")
+                instance = super(FileAuditManager, cls).__new__(cls)
+                instance._file_name = file_name
+                instance._buffered = buffered
+                instance._closed = False
+                instance._segments = None
+                instance._file = None
+                # an optional CachedTimestampFormatter for the per-message timestamp
+                instance._timestamps = timestamps
+                # an optional HotPathProfile splitting time between formatting and I/O
+                instance._profile = profile
+                if segmented:
+                    instance._segments = SegmentedLog(file_name, max_segment_bytes, segment_interval)
+                    instance._segments.write_lines([f"Log started: {datetime.datetime.now()}\n"])
+                    atexit.register(instance.close)
+                elif process_safe:
+                    instance._file = LockedAppendWriter(file_name)
+                    instance._file.write(f"Log started: {datetime.datetime.now()}\n")
+                    os.register_at_fork(after_in_child=instance._after_fork_in_child)
+                    atexit.register(instance.close)
+                else:
+                    with open(instance._file_name, 'a') as file:
+                        file.write(f"Log started: {datetime.datetime.now()}\n")
+                if buffered:
+                    instance._start_writer(batch_size, flush_interval, max_queue_size)
+                cls._instance = instance
         return cls._instance
 
     def log_message(self, message):
+        if self._buffered and not self._closed:
+            # blocks when the queue is full, pushing back on producers; the writer thread stamps the message
+            self._queue.put(message)
+            return
+        with self._lock:
+            if self._closed and self._segments is not None:
+                # closed segments are sealed and compressed, so there is nowhere to append
+                warnings.warn(f"FileAuditManager is closed, dropping message: {message}", RuntimeWarning, stacklevel=2)
+                return
+            line = f"{self._timestamp()}: {message}\n"
+            start = time.perf_counter() if self._profile else None
+            if self._segments is not None:
+                self._segments.write_lines([line])
+                self._segments.flush()
+            elif self._file is not None and not self._closed:
+                self._file.write(line)
+            else:
+                # the default mode, and any mode once closed (e.g. logging during interpreter shutdown)
+                with open(self._file_name, 'a') as file:
+                    file.write(line)
+            if self._profile:
+                self._profile.add_io(time.perf_counter() - start)
+
+    def query(self, start=None, end=None):
+        '''yield the audit lines logged between the start and end datetimes (inclusive, to the second)'''
+        if self._segments is None:
+            raise RuntimeError('Time-range queries need segmented output (max_segment_bytes or segment_interval)')
+        self.flush()
+        return self._segments.query(start, end)
+
+    def flush(self):
+        # wait until every queued message has been written
+        if self._buffered and not self._closed:
+            self._queue.join()
+        if self._segments is not None:
+            self._segments.flush()
+
+    def close(self):
+        # drain the queue, stop the writer thread and close the output; safe to call more than once
         with self._lock:
-            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            with open(self._file_name, 'a') as file:
-                file.write(f"{timestamp}: {message}\n")
+            if self._closed:
+                return
+            self._closed = True
+        if self._buffered:
+            self._queue.put(None)
+            self._writer.join()
+            # messages that raced with close() land after the sentinel
+            leftovers = []
+            while not self._queue.empty():
+                leftovers.append(self._queue.get_nowait())
+            self._write_lines(self._stamp(leftovers))
+        if self._file is not None:
+            self._file.close()
+        if self._segments is not None:
+            self._segments.close()
+
+    def _timestamp(self):
+        start = time.perf_counter() if self._profile else None
+        if self._timestamps is not None:
+            timestamp = self._timestamps.now()
+        else:
+            timestamp = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+        if self._profile:
+            self._profile.add_format(time.perf_counter() - start)
+        return timestamp
+
+    def _stamp(self, messages):
+        # stamped by the single writer, so timestamps never go backwards in the output,
+        # which time-range queries rely on
+        return [f"{self._timestamp()}: {message}\n" for message in messages]
+
+    def _write_lines(self, lines):
+        if self._segments is not None:
+            self._segments.write_lines(lines)
+        else:
+            self._file.write(''.join(lines))
+
+    def _flush_output(self):
+        if self._segments is not None:
+            self._segments.flush()
+        else:
+            self._file.flush()
+
+    def _start_writer(self, batch_size, flush_interval, max_queue_size):
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        if self._file is None and self._segments is None:
+            self._file = open(self._file_name, 'a')
+        self._start_writer_thread()
+        atexit.register(self.close)
+
+    def _start_writer_thread(self):
+        self._writer = threading.Thread(target=self._write_batches, name='FileAuditManager-writer', daemon=True)
+        self._writer.start()
+
+    def _after_fork_in_child(self):
+        # locks may have been held by parent threads that do not exist in the child
+        FileAuditManager._lock = threading.Lock()
+        if FileAuditManager._instance is not self or self._closed:
+            return
+        self._file.reopen()
+        if self._buffered:
+            # the parent's queued records are the parent's to write, and its writer thread did not survive the fork
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._start_writer_thread()
+
+    def _write_batches(self):
+        last_flush = time.monotonic()
+        while True:
+            batch = [self._queue.get()]
+            # group-commit whatever else is already waiting, up to batch_size messages
+            while len(batch) < self._batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            closing = batch[-1] is None
+            if closing:
+                batch.pop()
+            lines = self._stamp(batch)
+            start = time.perf_counter() if self._profile else None
+            self._write_lines(lines)
+            # hand data to the OS once the queue goes idle, or at least every flush_interval under load
+            now = time.monotonic()
+            if closing or self._queue.empty() or now - last_flush >= self._flush_interval:
+                self._flush_output()
+                last_flush = now
+            if self._profile:
+                self._profile.add_io(time.perf_counter() - start)
+            for _ in range(len(batch) + closing):
+                self._queue.task_done()
+            if closing:
+                return
+
+
+############################################################################
+# Benchmark
+############################################################################
+
+
+def benchmark_audit_throughput(n_messages=20000, thread_counts=(1, 8, 64)):
+    '''compare messages/sec of the synchronous and buffered modes across thread counts'''
+    with tempfile.TemporaryDirectory() as directory:
+        _run_audit_benchmark(directory, n_messages, thread_counts)
+    FileAuditManager._instance = None
+
+
+def _run_audit_benchmark(directory, n_messages, thread_counts):
+    for buffered in (False, True):
+        for n_threads in thread_counts:
+            file_name = os.path.join(directory, f'audit_{buffered}_{n_threads}.log')
+            FileAuditManager._instance = None
+            manager = FileAuditManager(file_name, buffered=buffered)
+            per_thread = n_messages // n_threads
+
+            def produce():
+                for i in range(per_thread):
+                    manager.log_message(f'benchmark message {i}')
+
+            threads = [threading.Thread(target=produce) for _ in range(n_threads)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            manager.flush()
+            elapsed = time.perf_counter() - start
+            manager.close()
+            mode = 'buffered' if buffered else 'synchronous'
+            print(f"{mode:>11}, {n_threads:>2} thread(s): {per_thread * n_threads / elapsed:12,.0f} messages/sec")
+
+
+def _write_records(file_name, process_safe, n_records, record_size):
+    '''worker process: log n_records fixed-size records through this process's FileAuditManager'''
+    FileAuditManager._instance = None
+    manager = FileAuditManager(file_name, process_safe=process_safe)
+    payload = str(os.getpid()).rjust(record_size, 'x')
+    for _ in range(n_records):
+        manager.log_message(payload)
+    manager.close()
+
+
+def benchmark_multiprocess_audit(n_processes=4, n_records=2000, record_sizes=(100, 64 * 1024)):
+    '''compare multi-process records/sec and count torn records for the default and process-safe writers'''
+    if fcntl is None:
+        print('process-safe mode needs fcntl; skipping')
+        return
+    context = multiprocessing.get_context('fork')
+    with tempfile.TemporaryDirectory() as directory:
+        for record_size in record_sizes:
+            for process_safe in (False, True):
+                file_name = os.path.join(directory, f'audit_{record_size}_{process_safe}.log')
+                workers = [context.Process(target=_write_records, args=(file_name, process_safe, n_records, record_size))
+                           for _ in range(n_processes)]
+                start = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+                pattern = re.compile(r'\d{4}-\d\d-\d\d \d\d:\d\d:\d\d: x*\d+$')
+                with open(file_name) as f:
+                    lines = [line.rstrip('\n') for line in f if not line.startswith('Log started')]
+                intact = sum(1 for line in lines if len(line) == TIMESTAMP_LENGTH + 2 + record_size
+                             and pattern.match(line))
+                mode = 'process-safe' if process_safe else 'default'
+                print(f"{mode:>12}, {record_size:>6} B records: "
+                      f"{n_processes * n_records / elapsed:10,.0f} records/sec, "
+                      f"{n_processes * n_records - intact} torn or missing")
+    FileAuditManager._instance = None
 
 
 ############################################################################
@@ -37,7 +502,7 @@ def test_file_audit_manager():
     logger = FileAuditManager('test_audit.log')
     logger.log_message('Test message from thread.')
 
-if __name__ == "__main__":
+def main():
     threads = []
     for i in range(10):
         thread = threading.Thread(target=test_file_audit_manager)
@@ -46,3 +511,7 @@ if __name__ == "__main__":
 
     for thread in threads:
         thread.join()
+
+
+if __name__ == "__main__":
+    main()
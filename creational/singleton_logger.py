@@ -1,20 +1,46 @@
 from abc import ABCMeta, abstractmethod
+from typing import Callable, Optional, Union
+import atexit
+import os
+import queue
+import tempfile
 import threading
+import time
 import logging
+import logging.handlers
+try:
+    from .timestamp_formatter import CachedAsctimeFormatter, profile_handler
+except ImportError:  # run as a script from this directory
+    from timestamp_formatter import CachedAsctimeFormatter, profile_handler
 
 
 '''a metaclass for creating singleton classes'''
 class SingletonMeta(type):
     _instances: dict = {}
+    # one lock per class, so creating one singleton never blocks another
+    _locks: dict = {}
+    # only guards the creation of the per-class locks
     _lock = threading.Lock()
 
     def __call__(cls, *args, **kwargs):
-        # acquire the lock to make sure that only one thread can enter this block at a time
-        with cls._lock:
+        # fast path: once the instance exists no lock is taken
+        try:
+            return cls._instances[cls]
+        except KeyError:
+            pass
+        # acquire the class lock and check again, so only one thread ever creates the instance
+        with cls._class_lock():
             if cls not in cls._instances:
                 cls._instances[cls] = super().__call__(*args, **kwargs)
         return cls._instances[cls]
 
+    def _class_lock(cls):
+        lock = cls._locks.get(cls)
+        if lock is None:
+            with cls._lock:
+                lock = cls._locks.setdefault(cls, threading.Lock())
+        return lock
+
 
 '''this metaclass combines the features of ABCMeta and SingletonMeta'''
 class SingletonABCMeta(ABCMeta, SingletonMeta):
@@ -25,29 +51,94 @@ class SingletonABCMeta(ABCMeta, SingletonMeta):
 '''an abstract class with the SingletonABCMeta metaclass'''
 class BaseLogger(metaclass=SingletonABCMeta):
     @abstractmethod
-    def debug(cls, message: str):
+    def debug(cls, message: Union[str, Callable[[], str]], *args, key: Optional[str] = None):
         pass
 
     @abstractmethod
-    def info(cls, message: str):
+    def info(cls, message: Union[str, Callable[[], str]], *args, key: Optional[str] = None):
         pass
 
     @abstractmethod
-    def warning(cls, message: str):
+    def warning(cls, message: Union[str, Callable[[], str]], *args, key: Optional[str] = None):
         pass
 
     @abstractmethod
-    def error(cls, message: str):
+    def error(cls, message: Union[str, Callable[[], str]], *args, key: Optional[str] = None):
         pass
 
     @abstractmethod
-    def critical(cls, message: str):
+    def critical(cls, message: Union[str, Callable[[], str]], *args, key: Optional[str] = None):
         pass
 
 
+'''per-key rate limit: keep 1 in `every` calls and/or at most `per_second` calls per second'''
+class RateLimit:
+    __slots__ = ('every', 'per_second', '_capacity', '_calls', '_tokens', '_last')
+
+    def __init__(self, every: Optional[int] = None, per_second: Optional[float] = None):
+        self.every = every
+        self.per_second = per_second
+        # a call needs a whole token, so below one call per second the bucket must still hold one
+        self._capacity = max(1.0, per_second or 0.0)
+        self._calls = 0
+        self._tokens = self._capacity
+        self._last = time.monotonic()
+
+    def allow(self) -> bool:
+        # counters are updated without a lock: under contention sampling is approximate, never blocking
+        self._calls += 1
+        if self.every is not None and (self._calls - 1) % self.every:
+            return False
+        if self.per_second is not None:
+            # token bucket refilled continuously, holding one second's worth of tokens, and at least one
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._last) * self.per_second)
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+        return True
+
+
+'''a QueueHandler with a bounded queue and a configurable overflow policy'''
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-new')
+
+    def __init__(self, max_size: int = 10000, overflow: str = 'block'):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy: {overflow}")
+        super().__init__(queue.Queue(maxsize=max_size))
+        self.overflow = overflow
+        self.dropped = 0
+
+    def prepare(self, record):
+        # hand the record over untouched; the listener thread does all of the formatting
+        return record
+
+    def enqueue(self, record):
+        if self.overflow == 'block':
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                self.dropped += 1
+                if self.overflow == 'drop-new':
+                    return
+            # drop-oldest: discard the head of the queue and retry
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+            except queue.Empty:
+                pass
+
+
 '''cconcrete implementation of BaseLogger'''
 class MyLogger(BaseLogger):
-    def __init__(self):
+    def __init__(self, log_file='my_log_file.log', use_queue=False, queue_size=10000, overflow='block',
+                 timestamps=None, profile=None):
         print('<Logger init> initializing logger...')
 
         # create a logger object with the specified name
@@ -56,7 +147,7 @@ class MyLogger(BaseLogger):
         self._logger.setLevel(logging.DEBUG)
 
         # create a file handler to log messages to a file
-        file_handler = logging.FileHandler('my_log_file.log')
+        file_handler = logging.FileHandler(log_file)
         # set the file handler logging level to DEBUG
         file_handler.setLevel(logging.DEBUG)
 
@@ -66,30 +157,156 @@ class MyLogger(BaseLogger):
         console_handler.setLevel(logging.INFO)
 
         # define the log message format
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        if timestamps is not None or profile is not None:
+            # reuse the per-second timestamp prefix and optionally split time between formatting and I/O
+            formatter = CachedAsctimeFormatter(log_format, timestamps, profile)
+        else:
+            formatter = logging.Formatter(log_format)
+        if profile is not None:
+            profile_handler(file_handler, profile)
+            profile_handler(console_handler, profile)
 
         # set the formatter for both the file and console handlers
         file_handler.setFormatter(formatter)
         console_handler.setFormatter(formatter)
 
-        # add the file and console handlers to the logger
-        self._logger.addHandler(file_handler)
-        self._logger.addHandler(console_handler)
+        self._rate_limits = {}
+        self._handlers = (file_handler, console_handler)
+        self._queue_handler = None
+        self._listener = None
+        if use_queue:
+            # callers only enqueue records; a listener thread formats and writes them to both sinks
+            self._queue_handler = BoundedQueueHandler(queue_size, overflow)
+            self._listener = logging.handlers.QueueListener(
+                self._queue_handler.queue, file_handler, console_handler, respect_handler_level=True)
+            self._logger.addHandler(self._queue_handler)
+            self._listener.start()
+            atexit.register(self.close)
+        else:
+            # add the file and console handlers to the logger
+            self._logger.addHandler(file_handler)
+            self._logger.addHandler(console_handler)
+
+    @property
+    def dropped_records(self) -> int:
+        '''number of records discarded by the queue overflow policy'''
+        return self._queue_handler.dropped if self._queue_handler else 0
+
+    def close(self):
+        '''
+        switch back to synchronous logging, then stop the listener thread once it has written
+        every queued record; records logged afterwards, e.g. during shutdown, still reach both sinks
+        '''
+        if self._listener is not None:
+            for handler in self._handlers:
+                self._logger.addHandler(handler)
+            # nothing drains the queue once the listener stops, so a later call must not reach it
+            self._logger.removeHandler(self._queue_handler)
+            self._listener.stop()
+            self._listener = None
+
+    def set_level(self, level: int):
+        self._logger.setLevel(level)
+
+    def set_rate_limit(self, key: str, every: Optional[int] = None, per_second: Optional[float] = None):
+        '''sample or throttle the calls that pass this key, e.g. from a hot loop'''
+        self._rate_limits[key] = RateLimit(every, per_second)
 
-    def debug(self, message: str):
-        self._logger.debug(message)
+    def debug(self, message, *args, key=None):
+        self._log(logging.DEBUG, message, args, key)
 
-    def info(self, message: str):
-        self._logger.info(message)
+    def info(self, message, *args, key=None):
+        self._log(logging.INFO, message, args, key)
 
-    def warning(self, message: str):
-        self._logger.warning(message)
+    def warning(self, message, *args, key=None):
+        self._log(logging.WARNING, message, args, key)
 
-    def error(self, message: str):
-        self._logger.error(message)
+    def error(self, message, *args, key=None):
+        self._log(logging.ERROR, message, args, key)
 
-    def critical(self, message: str):
-        self._logger.critical(message)
+    def critical(self, message, *args, key=None):
+        self._log(logging.CRITICAL, message, args, key)
+
+    def _log(self, level, message, args, key):
+        # nothing is built or formatted for records below the active level
+        if not self._logger.isEnabledFor(level):
+            return
+        if key is not None:
+            rate_limit = self._rate_limits.get(key)
+            if rate_limit is not None and not rate_limit.allow():
+                return
+        if callable(message):
+            message = message()
+        # args are %-merged by the handlers, only once the record is actually emitted
+        self._logger.log(level, message, *args, stacklevel=3)
+
+
+############################################################################
+# Benchmark
+############################################################################
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def benchmark_logger_latency(n_messages=20000):
+    '''compare caller-side latency percentiles of the synchronous and queued modes'''
+    with tempfile.TemporaryDirectory() as directory:
+        for use_queue in (False, True):
+            SingletonMeta._instances.pop(MyLogger, None)
+            logger = MyLogger(os.path.join(directory, 'benchmark.log'), use_queue=use_queue)
+            latencies = []
+            for i in range(n_messages):
+                start = time.perf_counter()
+                # debug records only reach the file sink, keeping the console quiet
+                logger.debug(f'benchmark message {i}')
+                latencies.append(time.perf_counter() - start)
+            logger.close()
+            for handler in list(logger._logger.handlers):
+                logger._logger.removeHandler(handler)
+                handler.close()
+            latencies.sort()
+            mode = 'queued' if use_queue else 'synchronous'
+            print(f"{mode:>11}: p50 {_percentile(latencies, 0.5) * 1e6:8.2f} us, "
+                  f"p99 {_percentile(latencies, 0.99) * 1e6:8.2f} us, "
+                  f"p99.9 {_percentile(latencies, 0.999) * 1e6:8.2f} us, "
+                  f"dropped {logger.dropped_records}")
+    SingletonMeta._instances.pop(MyLogger, None)
+
+
+def benchmark_lazy_logging(n_calls=200_000):
+    '''measure the cost of filtered-out calls and sustained throughput under a rate-limited log storm'''
+    with tempfile.TemporaryDirectory() as directory:
+        SingletonMeta._instances.pop(MyLogger, None)
+        logger = MyLogger(os.path.join(directory, 'benchmark.log'))
+        payload = list(range(20))
+        logger.set_level(logging.INFO)
+        calls = {
+            'eager f-string': lambda: logger.debug(f'payload {payload}'),
+            'format + args': lambda: logger.debug('payload %s', payload),
+            'callable': lambda: logger.debug(lambda: f'payload {payload}'),
+        }
+        for label, call in calls.items():
+            start = time.perf_counter()
+            for _ in range(n_calls):
+                call()
+            elapsed = time.perf_counter() - start
+            print(f"filtered out, {label:>14}: {elapsed / n_calls * 1e9:8.1f} ns/call")
+        logger.set_level(logging.DEBUG)
+        logger.set_rate_limit('storm', per_second=1000)
+        for key in (None, 'storm'):
+            start = time.perf_counter()
+            for i in range(n_calls):
+                logger.debug('storm message %d', i, key=key)
+            elapsed = time.perf_counter() - start
+            label = 'rate limited' if key else 'unlimited'
+            print(f"log storm, {label:>12}: {n_calls / elapsed:12,.0f} calls/sec")
+        for handler in list(logger._logger.handlers):
+            logger._logger.removeHandler(handler)
+            handler.close()
+    SingletonMeta._instances.pop(MyLogger, None)
 
 
 ############################################################################
@@ -97,12 +314,17 @@ class MyLogger(BaseLogger):
 ############################################################################
 
 
-# create an instance of MyLogger
-logger = MyLogger()
+def main():
+    # create an instance of MyLogger
+    logger = MyLogger()
+
+    # log different types of messages
+    logger.debug('This is a debug message')
+    logger.info('This is an info message')
+    logger.warning('This is a warning message')
+    logger.error('This is an error message')
+    logger.critical('This is a critical message')
+
 
-# log different types of messages
-logger.debug('This is a debug message')
-logger.info('This is an info message')
-logger.warning('This is a warning message')
-logger.error('This is an error message')
-logger.critical('This is a critical message')
+if __name__ == "__main__":
+    main()
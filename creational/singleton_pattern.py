@@ -1,4 +1,6 @@
+import os
 import threading
+import time
 from datetime import datetime
 from typing import Any
 
@@ -84,13 +86,6 @@ class MetaSingletonEager(type):
         return cls._instances[cls]
 
 
-'''the implementation of MetaSingletonEager'''
-class ConcreteMetaSingletonEager(metaclass=MetaSingletonEager):
-    def __init__(self) -> None:
-        print('initializing <child>...')
-        pass
-
-
 '''thread-safe implementation'''
 class ThreadSafeSingleton:
     # class-level variable to store single class instance
@@ -112,16 +107,67 @@ class ThreadSafeSingleton:
 '''thread-safe metaclass implementation'''
 class MetaThreadSafeSingleton(type):
     _instances: dict = {}
+    # one lock per class, so creating one singleton never blocks another
+    _locks: dict = {}
+    # only guards the creation of the per-class locks
     _lock = threading.Lock()
 
     def __call__(cls, *args, **kwargs):
 
-        # acquire the lock to ensure thread safety
-        with cls._lock:
+        # fast path: once the instance exists no lock is taken
+        try:
+            return cls._instances[cls]
+        except KeyError:
+            pass
+
+        # double-checked locking: re-check under the class lock before creating the instance
+        with cls._class_lock():
             if cls not in cls._instances:
                 cls._instances[cls] = super().__call__(*args, **kwargs)
             return cls._instances[cls]
 
+    def _class_lock(cls):
+        lock = cls._locks.get(cls)
+        if lock is None:
+            with cls._lock:
+                lock = cls._locks.setdefault(cls, threading.Lock())
+        return lock
+
+
+'''
+fork-safety hooks: a forked child inherits the parent's locks in whatever state they were in,
+possibly held by a thread that does not exist in the child
+'''
+_fork_safety_registered = False
+# whether children drop the instances; once any caller asks for it, it stays on
+_fork_reinitialize = False
+
+
+def enable_fork_safety(reinitialize: bool = False):
+    '''reset the thread-safe singletons' locks in forked children; optionally drop instances so each child builds its own'''
+    global _fork_safety_registered, _fork_reinitialize
+    # the hook is registered once, and the strongest option asked for so far applies
+    _fork_reinitialize = _fork_reinitialize or reinitialize
+    if _fork_safety_registered:
+        return
+    _fork_safety_registered = True
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _after_fork_in_child():
+    MetaThreadSafeSingleton._lock = threading.Lock()
+    MetaThreadSafeSingleton._locks.clear()
+    classes = [ThreadSafeSingleton]
+    while classes:
+        cls = classes.pop()
+        classes.extend(cls.__subclasses__())
+        if '_lock' in vars(cls):
+            cls._lock = threading.Lock()
+        if _fork_reinitialize and '_instance' in vars(cls):
+            cls._instance = None
+    if _fork_reinitialize:
+        MetaThreadSafeSingleton._instances.clear()
+
 
 '''the implementation of MetaThreadSafeSingleton'''
 class ConcreteMetaThreadSafeSingleton(metaclass=MetaThreadSafeSingleton):
@@ -129,51 +175,111 @@ class ConcreteMetaThreadSafeSingleton(metaclass=MetaThreadSafeSingleton):
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
 
 
+############################################################################
+# Benchmark
+############################################################################
+
+
+'''the previous MetaThreadSafeSingleton, which takes one global lock on every call'''
+class _GlobalLockSingletonMeta(type):
+    _instances: dict = {}
+    _lock = threading.Lock()
+
+    def __call__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls not in cls._instances:
+                cls._instances[cls] = super().__call__(*args, **kwargs)
+            return cls._instances[cls]
+
+
+def benchmark_singleton_contention(n_calls=200_000, thread_counts=(1, 8, 64)):
+    '''compare calls/sec under contention and check that __init__ runs exactly once'''
+    for meta in (_GlobalLockSingletonMeta, MetaThreadSafeSingleton):
+        for n_threads in thread_counts:
+            init_calls = []
+
+            class Counted(metaclass=meta):
+                def __init__(self):
+                    # widen the race window between the check and the creation
+                    time.sleep(0.001)
+                    init_calls.append(1)
+
+            barrier = threading.Barrier(n_threads)
+            per_thread = n_calls // n_threads
+
+            def call():
+                barrier.wait()
+                for _ in range(per_thread):
+                    Counted()
+
+            threads = [threading.Thread(target=call) for _ in range(n_threads)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+            print(f"{meta.__name__:>25}, {n_threads:>2} thread(s): "
+                  f"{per_thread * n_threads / elapsed:12,.0f} calls/sec, __init__ ran {len(init_calls)}x")
+
+
 ############################################################################
 # Usage
 ############################################################################
 
 
-# classic GoF implementation
-s1_1 = ClassicSingleton.get_instance()
-s1_2 = ClassicSingleton.get_instance()
-print(s1_1 is s1_2) # expected True
+def main():
+    # classic GoF implementation
+    s1_1 = ClassicSingleton.get_instance()
+    s1_2 = ClassicSingleton.get_instance()
+    print(s1_1 is s1_2) # expected True
+
+    # simple python way
+    s2_1 = SimpleSingleton()
+    s2_2 = SimpleSingleton()
+    print(s2_1 is s2_2) # expected True
+
+    # best singleton implementation with lazy initialization
+    s3_1 = ConcreteMetaSingletonLazy()
+    s3_2 = ConcreteMetaSingletonLazy()
+    print(s3_1 is s3_2) # expected True
+
+    # best singleton implementation with eager loading:
+    # defining the class is what creates its instance, so the example class lives here
+    # rather than at module level, where importing the module would build it
+    class ConcreteMetaSingletonEager(metaclass=MetaSingletonEager):
+        def __init__(self) -> None:
+            print('initializing <child>...')
+            pass
 
-# simple python way
-s2_1 = SimpleSingleton()
-s2_2 = SimpleSingleton()
-print(s2_1 is s2_2) # expected True
+    s4_1 = ConcreteMetaSingletonEager()
+    s4_2 = ConcreteMetaSingletonEager()
+    print(s4_1 is s4_2) # expected True
 
-# best singleton implementation with lazy initialization
-s3_1 = ConcreteMetaSingletonLazy()
-s3_2 = ConcreteMetaSingletonLazy()
-print(s3_1 is s3_2) # expected True
+    # thread-safe implementation
+    s5 = ThreadSafeSingleton()
 
-# best singleton implementation with eager loading
-s4_1 = ConcreteMetaSingletonEager()
-s4_2 = ConcreteMetaSingletonEager()
-print(s4_1 is s4_2) # expected True
+    # thread-safe metaclass implementation
+    def get_singleton_instance():
+        s = ConcreteMetaThreadSafeSingleton()
+        print(s.time())
 
-# thread-safe implementation
-s5 = ThreadSafeSingleton()
+    # create a list to store threads
+    threads = []
 
-# thread-safe metaclass implementation
-def get_singleton_instance():
-    s = ConcreteMetaThreadSafeSingleton()
-    print(s.time())
+    # create 10 thread objects, appending each to the threads list
+    for i in range(10):
+        t = threading.Thread(target=get_singleton_instance)
+        threads.append(t)
 
-# create a list to store threads
-threads = []
+    # start each thread in the threads list
+    for t in threads:
+        t.start()
 
-# create 10 thread objects, appending each to the threads list
-for i in range(10):
-    t = threading.Thread(target=get_singleton_instance)
-    threads.append(t)
+    # wait for each thread to finish
+    for t in threads:
+        t.join()
 
-# start each thread in the threads list
-for t in threads:
-    t.start()
 
-# wait for each thread to finish
-for t in threads:
-    t.join()
+if __name__ == "__main__":
+    main()
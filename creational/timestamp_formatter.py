@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+
+'''
+formats timestamps for the audit and logging hot paths:
+the second-resolution prefix is rendered once per second and reused,
+only the millisecond part is rendered per call
+'''
+class CachedTimestampFormatter:
+    def __init__(self, fmt: str = '%Y-%m-%d %H:%M:%S', msecs: bool = False):
+        self.fmt = fmt
+        self.msecs = msecs
+        # (epoch second, rendered prefix), swapped as one tuple so readers never see a torn pair
+        self._cache = (None, '')
+
+    def format(self, timestamp: float) -> str:
+        second = int(timestamp)
+        cached_second, prefix = self._cache
+        if second != cached_second:
+            prefix = time.strftime(self.fmt, time.localtime(second))
+            self._cache = (second, prefix)
+        if self.msecs:
+            return f"{prefix},{int((timestamp - second) * 1000):03d}"
+        return prefix
+
+    def now(self) -> str:
+        return self.format(time.time())
+
+
+'''accumulates the time a hot path spends formatting versus doing I/O'''
+class HotPathProfile:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = 0
+        self.format_seconds = 0.0
+        self.io_seconds = 0.0
+
+    def add_format(self, seconds: float, records: int = 1):
+        with self._lock:
+            self.records += records
+            self.format_seconds += seconds
+
+    def add_io(self, seconds: float):
+        with self._lock:
+            self.io_seconds += seconds
+
+    def report(self) -> dict:
+        with self._lock:
+            total = self.format_seconds + self.io_seconds
+            return {
+                'records': self.records,
+                'format_seconds': self.format_seconds,
+                'io_seconds': self.io_seconds,
+                'format_share': self.format_seconds / total if total else 0.0,
+            }
+
+
+'''logging.Formatter that renders %(asctime)s through a CachedTimestampFormatter'''
+class CachedAsctimeFormatter(logging.Formatter):
+    def __init__(self, fmt=None, timestamps: CachedTimestampFormatter = None, profile: HotPathProfile = None):
+        super().__init__(fmt)
+        self.timestamps = timestamps or CachedTimestampFormatter()
+        self.profile = profile
+
+    def formatTime(self, record, datefmt=None):
+        if datefmt is not None:
+            return super().formatTime(record, datefmt)
+        if self.timestamps.msecs:
+            return self.timestamps.format(record.created)
+        # matches logging's default '%Y-%m-%d %H:%M:%S,mmm'
+        return f"{self.timestamps.format(record.created)},{int(record.msecs):03d}"
+
+    def format(self, record):
+        if self.profile is None:
+            return super().format(record)
+        # a record reaching several handlers is formatted once per handler but counted once
+        first = not hasattr(record, 'format_seconds')
+        start = time.perf_counter()
+        message = super().format(record)
+        record.format_seconds = time.perf_counter() - start
+        self.profile.add_format(record.format_seconds, records=1 if first else 0)
+        return message
+
+
+def profile_handler(handler: logging.Handler, profile: HotPathProfile):
+    '''attribute the part of handler.emit() not spent in formatting to I/O'''
+    emit = handler.emit
+
+    def timed_emit(record):
+        start = time.perf_counter()
+        emit(record)
+        profile.add_io(time.perf_counter() - start - getattr(record, 'format_seconds', 0.0))
+
+    handler.emit = timed_emit
+
+
+############################################################################
+# Benchmark
+############################################################################
+
+
+def benchmark_timestamp_formatting(n_calls=500_000):
+    '''compare datetime.strftime per call against the cached formatter'''
+    cached = CachedTimestampFormatter()
+    variants = {
+        'datetime.strftime': lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'cached': cached.now,
+    }
+    for label, render in variants.items():
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            render()
+        elapsed = time.perf_counter() - start
+        print(f"{label:>17}: {elapsed / n_calls * 1e9:8.1f} ns/timestamp")
+
+
+if __name__ == "__main__":
+    benchmark_timestamp_formatting()
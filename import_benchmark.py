@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# modules that must import without side effects, each with its import-time budget in seconds
+IMPORT_BUDGETS = {
+    'creational': 0.05,
+    'structural': 0.05,
+    'behavioral': 0.05,
+    'creational.singleton_pattern': 0.25,
+    'creational.singleton_logger': 0.25,
+    'creational.singleton_FileAuditManager': 0.25,
+    'creational.timestamp_formatter': 0.25,
+    'creational.simple_factory_pattern': 0.25,
+    'creational.builder_pattern': 0.25,
+    'structural.adapter_pattern': 0.3,
+    'behavioral.observer_pattern': 0.25,
+    # numpy is optional; when installed it dominates these modules' import time
+    'behavioral.state_pattern': 0.5,
+    'behavioral.strategy_pattern': 0.5,
+}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+############################################################################
+# Benchmark
+############################################################################
+
+
+def _run_import(statement, directory, timeout):
+    '''run `statement` in a fresh interpreter inside `directory`, return (seconds, returncode, output)'''
+    env = dict(os.environ, PYTHONPATH=HERE, PYTHONDONTWRITEBYTECODE='1')
+    start = time.perf_counter()
+    try:
+        result = subprocess.run([sys.executable, '-c', statement], cwd=directory, env=env,
+                                capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # e.g. a demo event loop running at import time
+        return timeout, None, ''
+    return time.perf_counter() - start, result.returncode, result.stdout + result.stderr
+
+
+def _best_of(statement, directory, repeat, timeout=10.0):
+    runs = [_run_import(statement, directory, timeout) for _ in range(repeat)]
+    return min(runs, key=lambda run: run[0])
+
+
+def benchmark_imports(budgets=IMPORT_BUDGETS, repeat=5):
+    '''time each import in a fresh interpreter, net of interpreter startup, and check it has no side effects'''
+    failures = []
+    # an empty working directory makes any file created by an import show up
+    with tempfile.TemporaryDirectory() as directory:
+        baseline, _, _ = _best_of('pass', directory, repeat)
+        for module, budget in budgets.items():
+            elapsed, returncode, output = _best_of(f'import {module}', directory, repeat)
+            elapsed = max(0.0, elapsed - baseline)
+            problems = []
+            if returncode is None:
+                problems.append("timed out")
+            elif returncode:
+                problems.append(f"failed: {output.strip().splitlines()[-1]}")
+            elif output:
+                problems.append(f"wrote output {output[:60]!r}")
+            if elapsed > budget:
+                problems.append(f"over budget ({budget * 1000:.0f} ms)")
+            created = os.listdir(directory)
+            if created:
+                problems.append(f"created files {created}")
+                for name in created:
+                    os.remove(os.path.join(directory, name))
+            status = 'ok' if not problems else 'FAIL: ' + ', '.join(problems)
+            print(f"{module:>38}: {elapsed * 1000:7.1f} ms  {status}")
+            if problems:
+                failures.append(module)
+    return failures
+
+
+############################################################################
+# Usage
+############################################################################
+
+
+def main():
+    failures = benchmark_imports()
+    if failures:
+        print(f"import regressions in: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
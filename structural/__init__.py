@@ -0,0 +1,38 @@
+'''structural design patterns; each submodule is imported only when one of its names is first used'''
+import importlib
+
+# public name -> submodule defining it; submodules are imported on first access
+_EXPORTS = {
+    "Contact": "adapter_pattern",
+    "ContactTable": "adapter_pattern",
+    "FileReader": "adapter_pattern",
+    "XMLReader": "adapter_pattern",
+    "JSONReader": "adapter_pattern",
+    "MappedFileReader": "adapter_pattern",
+    "MappedXMLReader": "adapter_pattern",
+    "MappedJSONReader": "adapter_pattern",
+    "ContactsAdapter": "adapter_pattern",
+    "XMLContactsAdapter": "adapter_pattern",
+    "JSONContactsAdapter": "adapter_pattern",
+    "ContactsCache": "adapter_pattern",
+    "CachedContactsAdapter": "adapter_pattern",
+    "ContactIndex": "adapter_pattern",
+    "ContactIngestor": "adapter_pattern",
+    "print_contact_data": "adapter_pattern",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    # cache it, so later lookups bypass __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,11 +1,38 @@
 from abc import ABC, abstractmethod
-from typing import List
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 import xml.etree.ElementTree as ET
+import hashlib
+import io
 import json
+import mmap
+import multiprocessing
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows; the RSS benchmark is skipped there
+    resource = None
+
+
+# the raw fields of a contact: (full_name, email, phone_number, is_friend); missing fields are None
+ContactRecord = Tuple[Optional[str], Optional[str], Optional[str], bool]
 
 
 '''contact data container class'''
 class Contact:
+    __slots__ = ('full_name', 'email', 'phone_number', 'is_friend')
+
     def __init__(self, full_name, email, phone_number, is_friend):
         self.full_name = full_name
         self.email = email
@@ -16,6 +43,81 @@ class Contact:
         return f"{self.full_name} ({self.email}) - {self.phone_number} {'(Friend)' if self.is_friend else ''}"
 
 
+'''compact string column: UTF-8 bytes packed into one buffer and addressed by offsets'''
+class _StringColumn:
+    __slots__ = ('_data', '_offsets', '_nulls')
+
+    def __init__(self):
+        self._data = bytearray()
+        self._offsets = array('Q', [0])
+        # one bit per value, set where the value is None (a missing XML element or a JSON null)
+        self._nulls = bytearray()
+
+    def append(self, value: Optional[str]):
+        index = len(self._offsets) - 1
+        if index & 7 == 0:
+            self._nulls.append(0)
+        if value is None:
+            self._nulls[index >> 3] |= 1 << (index & 7)
+        else:
+            self._data += value.encode('utf-8')
+        self._offsets.append(len(self._data))
+
+    def __getitem__(self, index: int) -> Optional[str]:
+        if self._nulls[index >> 3] & (1 << (index & 7)):
+            return None
+        return self._data[self._offsets[index]:self._offsets[index + 1]].decode('utf-8')
+
+    def nbytes(self) -> int:
+        return len(self._data) + self._offsets.itemsize * len(self._offsets) + len(self._nulls)
+
+
+'''columnar contact storage; Contact objects are only materialized on access'''
+class ContactTable:
+    def __init__(self):
+        self._full_names = _StringColumn()
+        self._emails = _StringColumn()
+        self._phone_numbers = _StringColumn()
+        # one bit per contact
+        self._friends = bytearray()
+        self._size = 0
+
+    def append(self, full_name: Optional[str], email: Optional[str], phone_number: Optional[str], is_friend: bool):
+        index = self._size
+        self._full_names.append(full_name)
+        self._emails.append(email)
+        self._phone_numbers.append(phone_number)
+        if index & 7 == 0:
+            self._friends.append(0)
+        if is_friend:
+            self._friends[index >> 3] |= 1 << (index & 7)
+        self._size += 1
+
+    def extend(self, records: Iterable[ContactRecord]):
+        for record in records:
+            self.append(*record)
+
+    def is_friend(self, index: int) -> bool:
+        return bool(self._friends[index >> 3] & (1 << (index & 7)))
+
+    def nbytes(self) -> int:
+        '''approximate size of the column buffers in bytes'''
+        return (self._full_names.nbytes() + self._emails.nbytes()
+                + self._phone_numbers.nbytes() + len(self._friends))
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index: int) -> Contact:
+        index = range(self._size)[index]
+        return Contact(self._full_names[index], self._emails[index],
+                       self._phone_numbers[index], self.is_friend(index))
+
+    def __iter__(self) -> Iterator[Contact]:
+        for index in range(self._size):
+            yield self[index]
+
+
 '''our base class for reading file data'''
 class FileReader(ABC) :
     def __init__(self, file_name):
@@ -25,6 +127,15 @@ class FileReader(ABC) :
     def read(self) -> str:
         pass
 
+    def open(self) -> BinaryIO:
+        '''open the file as a binary stream for incremental parsing'''
+        return open(self.file_name, 'rb')
+
+    @contextmanager
+    def buffer(self) -> Iterator[Union[str, bytes]]:
+        '''the contents to parse: read() by default, readers that can avoid a copy yield a bytes-like object'''
+        yield self.read()
+
 
 '''abstract base class for all Contact Data Adapters'''
 class ContactsAdapter(ABC):
@@ -35,12 +146,34 @@ class ContactsAdapter(ABC):
     def get_contacts(self) -> List[Contact]:
         pass
 
+    def iter_contacts(self) -> Iterator[Contact]:
+        '''yield contacts one at a time; adapters override this to stream from the source'''
+        return iter(self.get_contacts())
+
+    def iter_records(self) -> Iterator[ContactRecord]:
+        '''yield the raw fields of each contact without building Contact objects'''
+        for contact in self.iter_contacts():
+            yield (contact.full_name, contact.email, contact.phone_number, contact.is_friend)
+
+    def get_contact_table(self) -> ContactTable:
+        '''fill a columnar ContactTable straight from the source'''
+        table = ContactTable()
+        table.extend(self.iter_records())
+        return table
+
+    def cache_options(self) -> tuple:
+        '''the adapter settings that change what it reads from a source, as part of cache keys'''
+        return ()
+
 
 '''specific implementation of the adapter to read XML Source data'''
 class XMLContactsAdapter(ContactsAdapter):
     def get_contacts(self):
-        # parse XML data into an ElementTree object
-        root = ET.fromstring(self.data_source.read()) # Read XML data from a file
+        # parse XML data into an ElementTree object; a mapped reader's bytes go straight to the parser
+        parser = ET.XMLParser()
+        with self.data_source.buffer() as data:
+            parser.feed(data)
+        root = parser.close()
         # extract contact information from the XML and create Contact objects
         contacts = []
         for elem in root.iter():
@@ -53,23 +186,173 @@ class XMLContactsAdapter(ContactsAdapter):
                 contacts.append(contact)
         return contacts
 
+    def iter_contacts(self):
+        for record in self.iter_records():
+            yield Contact(*record)
+
+    def iter_records(self):
+        # parse the XML incrementally so memory stays flat regardless of the file size
+        with self.data_source.open() as f:
+            # the elements still open, so each finished contact can be detached from its own parent
+            parents = []
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    parents.append(elem)
+                    continue
+                parents.pop()
+                if elem.tag == 'contact':
+                    # an empty element reads as None, as in get_contacts()
+                    full_name = _child_text(elem, 'full_name')
+                    email = _child_text(elem, 'email')
+                    phone_number = _child_text(elem, 'phone_number')
+                    is_friend = elem.findtext('is_friend', '').lower() == 'true'
+                    yield (full_name, email, phone_number, is_friend)
+                    # free the finished contact, however deeply it is nested in wrapper elements
+                    elem.clear()
+                    if parents:
+                        parents[-1].remove(elem)
+
+
+def _child_text(elem: ET.Element, tag: str) -> Optional[str]:
+    child = elem.find(tag)
+    return child.text if child is not None else None
+
 
 '''specific implementation of the adapter to read JSON Source data'''
 class JSONContactsAdapter(ContactsAdapter):
+    # number of characters read from the source per step when streaming
+    chunk_size = 64 * 1024
+
+    def __init__(self, data_source: FileReader, line_delimited: bool = False):
+        super().__init__(data_source)
+        # newline-delimited JSON: one contact object per line instead of a 'contacts' array
+        self.line_delimited = line_delimited
+
+    def cache_options(self):
+        return (('line_delimited', self.line_delimited),)
+
     def get_contacts(self):
-        # parse JSON data into a dictionary
-        data_dict = json.loads(self.data_source.read()) # Read JSON data from a file
+        if self.line_delimited:
+            return list(self.iter_contacts())
+        # parse JSON data into a dictionary, decoding a mapped reader's bytes exactly once
+        with self.data_source.buffer() as data:
+            data_dict = json.loads(data if isinstance(data, str) else str(data, 'utf-8'))
         # extract contact information from the dictionary and create Contact objects
         contacts = []
         for contact_data in data_dict['contacts']:
-            full_name = contact_data['full_name']
-            email = contact_data['email']
-            phone_number = contact_data['phone_number']
-            is_friend = contact_data['is_friend']
-            contact = Contact(full_name, email, phone_number, is_friend)
-            contacts.append(contact)
+            contacts.append(self._to_contact(contact_data))
         return contacts
 
+    def iter_contacts(self):
+        for record in self.iter_records():
+            yield Contact(*record)
+
+    def iter_records(self):
+        # decode the source in bounded chunks so the first contact arrives before the file is fully read
+        with io.TextIOWrapper(self.data_source.open(), encoding='utf-8') as f:
+            if self.line_delimited:
+                objects = self._iter_lines(f)
+            else:
+                objects = self._iter_array(f)
+            for contact_data in objects:
+                yield self._to_record(contact_data)
+
+    @staticmethod
+    def _to_record(contact_data: dict) -> ContactRecord:
+        full_name = contact_data['full_name']
+        email = contact_data['email']
+        phone_number = contact_data['phone_number']
+        is_friend = contact_data['is_friend']
+        return (full_name, email, phone_number, is_friend)
+
+    @classmethod
+    def _to_contact(cls, contact_data: dict) -> Contact:
+        return Contact(*cls._to_record(contact_data))
+
+    @staticmethod
+    def _iter_lines(f) -> Iterator[dict]:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+    def _iter_array(self, f) -> Iterator[dict]:
+        stream = _JSONStream(f, self.chunk_size)
+        # walk the top-level object key by key, skipping every value before 'contacts'
+        stream.expect('{')
+        while True:
+            if stream.peek() in ('}', ''):
+                raise ValueError("no 'contacts' array found in JSON source")
+            key = stream.decode()
+            stream.expect(':')
+            if key == 'contacts':
+                break
+            stream.decode()
+            if stream.peek() == ',':
+                stream.pos += 1
+        stream.expect('[')
+        if stream.peek() == ']':
+            return
+        # decode one contact object at a time, only keeping the unparsed tail in memory
+        while True:
+            yield stream.decode()
+            separator = stream.peek()
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError("unterminated 'contacts' array in JSON source")
+            stream.pos += 1
+
+
+'''reads JSON values one at a time from a text stream, keeping only the unparsed tail in memory'''
+class _JSONStream:
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+
+    def _fill(self) -> bool:
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        '''the next non-whitespace character, or '' at the end of the stream'''
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"expected {char!r} in JSON source, found {found or 'end of input'!r}")
+        self.pos += 1
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # the value is cut off at the end of the buffer
+                if not self._fill():
+                    raise
+                continue
+            # a number or literal ending with the buffer may continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
 
 '''specific implementation of the file reader to be used with XML Files'''
 class XMLReader(FileReader):
@@ -87,34 +370,590 @@ class JSONReader(FileReader):
             return f.read()
 
 
+'''mixin for readers that expose the file through a read-only memory map instead of a copy'''
+class MappedFileReader(FileReader):
+    @contextmanager
+    def buffer(self):
+        with open(self.file_name, 'rb') as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # empty files, pipes and some special files cannot be mapped
+                mapped = None
+            if mapped is None:
+                yield f.read()
+                return
+            with mapped, memoryview(mapped) as view:
+                yield view
+
+
+'''memory-mapped variant of XMLReader'''
+class MappedXMLReader(MappedFileReader, XMLReader):
+    pass
+
+
+'''memory-mapped variant of JSONReader'''
+class MappedJSONReader(MappedFileReader, JSONReader):
+    pass
+
+
+'''LRU cache of parsed contact tables, keyed on the identity of the source file'''
+class ContactsCache:
+    def __init__(self, max_contacts: Optional[int] = None, max_bytes: Optional[int] = None,
+                 cache_dir: Optional[str] = None, hash_contents: bool = False):
+        # eviction bounds; None means unbounded
+        self.max_contacts = max_contacts
+        self.max_bytes = max_bytes
+        # optional directory of pickled tables so a warm restart skips parsing entirely
+        self.cache_dir = cache_dir
+        # also key on a content hash, for sources whose mtime is not trustworthy
+        self.hash_contents = hash_contents
+        self._tables = OrderedDict()
+        self._contacts = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key_for(self, adapter: ContactsAdapter) -> tuple:
+        file_name = os.path.abspath(adapter.data_source.file_name)
+        stat = os.stat(file_name)
+        digest = None
+        if self.hash_contents:
+            with adapter.data_source.buffer() as data:
+                digest = hashlib.sha256(data.encode('utf-8') if isinstance(data, str) else data).hexdigest()
+        return (type(adapter).__name__, adapter.cache_options(), file_name, stat.st_mtime_ns, stat.st_size, digest)
+
+    def get_table(self, adapter: ContactsAdapter) -> ContactTable:
+        '''return the cached table for the adapter's source, parsing it only when the file changed'''
+        key = self.key_for(adapter)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                self.hits += 1
+                return table
+        table = self._load(key)
+        from_disk = table is not None
+        if not from_disk:
+            table = adapter.get_contact_table()
+            self._save(key, table)
+        with self._lock:
+            if from_disk:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+            self._insert(key, table)
+        return table
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._tables),
+                'contacts': self._contacts,
+                'bytes': self._bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+            self._contacts = 0
+            self._bytes = 0
+
+    def _insert(self, key: tuple, table: ContactTable):
+        # entries for older versions of the same file, read the same way, can never be hit again
+        adapter_name, options, file_name, *_ = key
+        source = (adapter_name, options, file_name)
+        for stale in [k for k in self._tables if k[:3] == source]:
+            self._remove(stale)
+        self._tables[key] = table
+        self._contacts += len(table)
+        self._bytes += table.nbytes()
+        while len(self._tables) > 1 and self._over_budget():
+            self._remove(next(iter(self._tables)))
+            self.evictions += 1
+
+    def _remove(self, key: tuple):
+        table = self._tables.pop(key)
+        self._contacts -= len(table)
+        self._bytes -= table.nbytes()
+
+    def _over_budget(self) -> bool:
+        return ((self.max_contacts is not None and self._contacts > self.max_contacts)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes))
+
+    def _disk_path(self, key: tuple) -> str:
+        name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{name}.pickle')
+
+    def _load(self, key: tuple) -> Optional[ContactTable]:
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _save(self, key: tuple, table: ContactTable):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._disk_path(key)
+        # write to a temporary file first so readers never see a partial pickle
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+
+'''adapter decorator that serves contacts from a ContactsCache'''
+class CachedContactsAdapter(ContactsAdapter):
+    def __init__(self, adapter: ContactsAdapter, cache: ContactsCache):
+        super().__init__(adapter.data_source)
+        self.adapter = adapter
+        self.cache = cache
+
+    def get_contacts(self):
+        return list(self.get_contact_table())
+
+    def iter_contacts(self):
+        return iter(self.get_contact_table())
+
+    def get_contact_table(self):
+        # the table is shared with the cache, so callers must treat it as read-only
+        return self.cache.get_table(self.adapter)
+
+
+'''lookup indexes over contacts from one or more adapters'''
+class ContactIndex:
+    def __init__(self):
+        self._contacts = []
+        self._by_email = {}
+        self._by_phone_number = {}
+        # (casefolded full name, position in _contacts), kept sorted for prefix search
+        self._names = []
+        # names added since the last sort; merged lazily on the next prefix search
+        self._unsorted_names = []
+        self._friends = []
+
+    @classmethod
+    def from_adapter(cls, adapter: ContactsAdapter) -> 'ContactIndex':
+        index = cls()
+        index.add_source(adapter)
+        return index
+
+    def add_source(self, adapter: ContactsAdapter):
+        '''index every contact of a newly ingested source'''
+        for contact in adapter.iter_contacts():
+            self.add(contact)
+
+    def add(self, contact: Contact):
+        # a later contact with the same email or phone number replaces the earlier one in the lookups
+        position = len(self._contacts)
+        self._contacts.append(contact)
+        self._by_email[contact.email] = contact
+        self._by_phone_number[contact.phone_number] = contact
+        self._unsorted_names.append((contact.full_name.casefold(), position))
+        if contact.is_friend:
+            self._friends.append(contact)
+
+    def find_by_email(self, email: str) -> Optional[Contact]:
+        return self._by_email.get(email)
+
+    def find_by_phone_number(self, phone_number: str) -> Optional[Contact]:
+        return self._by_phone_number.get(phone_number)
+
+    def find_by_name_prefix(self, prefix: str) -> List[Contact]:
+        '''return the contacts whose full name starts with prefix (case-insensitive), sorted by name'''
+        if self._unsorted_names:
+            # timsort merges the already sorted run with the new entries cheaply
+            self._names.extend(self._unsorted_names)
+            self._unsorted_names.clear()
+            self._names.sort()
+        prefix = prefix.casefold()
+        matches = []
+        for i in range(bisect_left(self._names, (prefix,)), len(self._names)):
+            name, position = self._names[i]
+            if not name.startswith(prefix):
+                break
+            matches.append(self._contacts[position])
+        return matches
+
+    @property
+    def friends(self) -> List[Contact]:
+        return self._friends
+
+    def __len__(self):
+        return len(self._contacts)
+
+
+'''parses many contact files in parallel across worker processes'''
+class ContactIngestor:
+    # which adapter handles which kind of file reader
+    adapter_types = {
+        XMLReader: XMLContactsAdapter,
+        JSONReader: JSONContactsAdapter,
+    }
+
+    def __init__(self, data_sources: Sequence[FileReader], processes: Optional[int] = None,
+                 ordered: bool = True, batch_size: int = 1000, max_pending: int = 4):
+        self.data_sources = list(data_sources)
+        self.processes = processes
+        # ordered=False yields each file's contacts as soon as a worker parses them
+        self.ordered = ordered
+        # records per message from a worker, and batches a worker may queue ahead of the consumer,
+        # so memory stays bounded however large each file is. In ordered mode a worker whose file
+        # is not being consumed yet spills its batches to a temporary file instead of waiting.
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+
+    @classmethod
+    def adapter_for(cls, data_source: FileReader) -> ContactsAdapter:
+        for reader_type, adapter_type in cls.adapter_types.items():
+            if isinstance(data_source, reader_type):
+                return adapter_type(data_source)
+        raise ValueError(f"No contacts adapter for reader: {type(data_source).__name__}")
+
+    def iter_records(self) -> Iterator[ContactRecord]:
+        # workers send back plain record tuples, which pickle far more compactly than Contact objects
+        n_workers = min(self.processes or os.cpu_count() or 1, len(self.data_sources))
+        if not n_workers:
+            return
+        context = multiprocessing.get_context()
+        spill_dir = spill_name = current = None
+        if self.ordered:
+            # file i goes to worker i % n_workers, whose own result queue then carries its files in order;
+            # a worker may only queue max_pending batches of the file being consumed and spills the others
+            spill_dir = tempfile.TemporaryDirectory(prefix='contacts-')
+            spill_name = spill_dir.name
+            current = context.Value('q', 0, lock=False)
+            budgets = [context.Semaphore(self.max_pending) for _ in range(n_workers)]
+            task_queues = [context.Queue() for _ in range(n_workers)]
+            result_queues = [context.Queue() for _ in range(n_workers)]
+        else:
+            # any idle worker takes the next file, and all of them report to one queue
+            budgets = [None] * n_workers
+            task_queues = [context.Queue()] * n_workers
+            result_queues = [context.Queue(self.max_pending * n_workers)] * n_workers
+        for index, data_source in enumerate(self.data_sources):
+            task_queues[index % n_workers].put((index, data_source))
+        for task_queue in task_queues:
+            task_queue.put(None)
+        workers = [context.Process(target=_ingest_records,
+                                   args=(task_queues[i], result_queues[i], self.batch_size,
+                                         budgets[i], current, spill_name),
+                                   daemon=True)
+                   for i in range(n_workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            remaining = len(self.data_sources)
+            index = 0
+            while remaining:
+                # ordered: drain file `index` from its worker's queue before moving on to the next file
+                worker_index = index % n_workers if self.ordered else 0
+                _, batch = result_queues[worker_index].get()
+                if batch is None:
+                    remaining -= 1
+                    index += 1
+                    if current is not None:
+                        current.value = index
+                elif isinstance(batch, BaseException):
+                    raise batch
+                elif isinstance(batch, str):
+                    # the batches a worker parsed before the consumer reached this file
+                    yield from _read_spilled(batch)
+                else:
+                    if budgets[worker_index] is not None:
+                        budgets[worker_index].release()
+                    yield from batch
+            for worker in workers:
+                worker.join()
+        finally:
+            # the consumer stopped early or a file failed
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+            if spill_dir is not None:
+                spill_dir.cleanup()
+
+    def iter_contacts(self) -> Iterator[Contact]:
+        for record in self.iter_records():
+            yield Contact(*record)
+
+    def get_contacts(self) -> List[Contact]:
+        return list(self.iter_contacts())
+
+    def get_contact_table(self) -> ContactTable:
+        table = ContactTable()
+        table.extend(self.iter_records())
+        return table
+
+
+def _ingest_records(tasks, results, batch_size: int, budget=None, current=None, spill_dir: Optional[str] = None):
+    '''
+    worker process: parse each file taken from tasks and send its records in batches of batch_size.
+    With `current` (ordered mode), batches of a file the consumer has not reached yet are pickled
+    to a file in spill_dir, whose path is sent once the consumer gets there or the file is parsed.
+    '''
+    for index, data_source in iter(tasks.get, None):
+        spill = None
+        try:
+            records = ContactIngestor.adapter_for(data_source).iter_records()
+            for batch in iter(lambda: list(islice(records, batch_size)), []):
+                if current is not None and current.value != index:
+                    if spill is None:
+                        spill = open(os.path.join(spill_dir, f'{index}.pickle'), 'wb')
+                    pickle.dump(batch, spill, protocol=pickle.HIGHEST_PROTOCOL)
+                    continue
+                if spill is not None:
+                    spill.close()
+                    results.put((index, spill.name))
+                    spill = None
+                # blocks while the consumer is max_pending batches behind
+                if budget is not None:
+                    budget.acquire()
+                results.put((index, batch))
+            if spill is not None:
+                spill.close()
+                results.put((index, spill.name))
+        except Exception as error:
+            if spill is not None:
+                spill.close()
+            try:
+                pickle.dumps(error)
+            except Exception:
+                error = RuntimeError(repr(error))
+            results.put((index, error))
+        else:
+            results.put((index, None))
+
+
+def _read_spilled(file_name: str) -> Iterator[ContactRecord]:
+    '''yield the records of the batches a worker spilled to file_name, then remove it'''
+    try:
+        with open(file_name, 'rb') as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    return
+                yield from batch
+    finally:
+        os.remove(file_name)
+
+
 '''simple display routine to display Contact data to the console'''
 def print_contact_data(contacts_source : ContactsAdapter):
     for contact in contacts_source.get_contacts():
         print(contact)
 
 
+############################################################################
+# Benchmark
+############################################################################
+
+
+def _write_sample_xml(file_name, n_contacts):
+    with open(file_name, 'w') as f:
+        f.write('<contacts>\n')
+        for i in range(n_contacts):
+            f.write(
+                f'<contact><full_name>Contact {i}</full_name>'
+                f'<email>contact{i}@example.com</email>'
+                f'<phone_number>555-{i % 10000:04d}</phone_number>'
+                f'<is_friend>{"true" if i % 2 else "false"}</is_friend></contact>\n'
+            )
+        f.write('</contacts>\n')
+
+
+def benchmark_xml_streaming(n_contacts=200_000):
+    '''compare contacts/sec and peak RSS growth of get_contacts() against the streaming iter_contacts()'''
+    if resource is None or 'fork' not in multiprocessing.get_all_start_methods():
+        print('measuring RSS needs the resource module and fork; skipping')
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'contacts.xml')
+        _write_sample_xml(file_name, n_contacts)
+        adapter = XMLContactsAdapter(XMLReader(file_name))
+        modes = {
+            'get_contacts': adapter.get_contacts,
+            'iter_contacts': lambda: sum(1 for _ in adapter.iter_contacts()),
+        }
+        for label, consume in modes.items():
+            # expat's buffers are invisible to tracemalloc, so peak memory is measured as RSS
+            elapsed, rss = _measure_rss(consume)
+            print(f"{label:>14}: {n_contacts / elapsed:12,.0f} contacts/sec, peak RSS +{rss / 2**20:8.1f} MiB")
+
+
+def _write_sample_json(file_name, n_contacts):
+    with open(file_name, 'w') as f:
+        json.dump({'contacts': [
+            {'full_name': full_name, 'email': email, 'phone_number': phone_number, 'is_friend': is_friend}
+            for full_name, email, phone_number, is_friend in _sample_records(n_contacts)
+        ]}, f)
+
+
+def _measure_rss(consume):
+    '''run consume() in a forked child; return (elapsed seconds, peak RSS growth in bytes)'''
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+
+    def child():
+        # tracemalloc cannot see mapped pages, the resident set size does
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        consume()
+        elapsed = time.perf_counter() - start
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        sender.send((elapsed, (after - before) * scale))
+
+    process = context.Process(target=child)
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def benchmark_mapped_readers(n_contacts=200_000):
+    '''compare wall time and peak RSS growth of get_contacts() through read() and through a memory map'''
+    if resource is None or 'fork' not in multiprocessing.get_all_start_methods():
+        print('measuring RSS needs the resource module and fork; skipping')
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        xml_file = os.path.join(directory, 'contacts.xml')
+        json_file = os.path.join(directory, 'contacts.json')
+        _write_sample_xml(xml_file, n_contacts)
+        _write_sample_json(json_file, n_contacts)
+        modes = {
+            # read() is the pre-mmap get_contacts() path: the whole file as a str, then parsed
+            'XMLReader': lambda: XMLContactsAdapter(XMLReader(xml_file)).get_contacts(),
+            'MappedXMLReader': lambda: XMLContactsAdapter(MappedXMLReader(xml_file)).get_contacts(),
+            'JSONReader': lambda: JSONContactsAdapter(JSONReader(json_file)).get_contacts(),
+            'MappedJSONReader': lambda: JSONContactsAdapter(MappedJSONReader(json_file)).get_contacts(),
+        }
+        for label, consume in modes.items():
+            elapsed, rss = _measure_rss(consume)
+            print(f"{label:>16}: {elapsed:8.3f} s, peak RSS +{rss / 2**20:8.1f} MiB")
+
+
+def benchmark_parallel_ingestion(n_files=32, n_contacts=20_000):
+    '''compare contacts/sec for a single worker against one worker per core, in file order and as parsed'''
+    with tempfile.TemporaryDirectory() as directory:
+        readers = []
+        for i in range(n_files):
+            file_name = os.path.join(directory, f'contacts_{i}.xml')
+            _write_sample_xml(file_name, n_contacts)
+            readers.append(XMLReader(file_name))
+        for ordered in (True, False):
+            for processes in sorted({1, os.cpu_count() or 1}):
+                ingestor = ContactIngestor(readers, processes=processes, ordered=ordered)
+                start = time.perf_counter()
+                count = sum(1 for _ in ingestor.iter_records())
+                elapsed = time.perf_counter() - start
+                mode = 'ordered' if ordered else 'unordered'
+                print(f"{mode:>9}, {processes:>3} process(es): {count / elapsed:12,.0f} contacts/sec")
+
+
+def benchmark_contact_index(n_contacts=1_000_000, n_lookups=100):
+    '''compare lookup latency of a ContactIndex against a linear scan of get_contacts() output'''
+    contacts = [Contact(*record) for record in _sample_records(n_contacts)]
+    start = time.perf_counter()
+    index = ContactIndex()
+    for contact in contacts:
+        index.add(contact)
+    index.find_by_name_prefix('')
+    print(f"index build: {time.perf_counter() - start:8.3f} s for {n_contacts:,} contacts")
+    step = max(1, n_contacts // n_lookups)
+    emails = [contacts[i].email for i in range(0, n_contacts, step)]
+    lookups = {
+        'list scan': lambda email: next(c for c in contacts if c.email == email),
+        'ContactIndex': index.find_by_email,
+    }
+    for label, find in lookups.items():
+        start = time.perf_counter()
+        for email in emails:
+            find(email)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>13}: {elapsed / len(emails) * 1e6:12.2f} us/lookup")
+
+
+'''the pre-__slots__ Contact layout, kept only as a memory baseline'''
+class _DictContact:
+    def __init__(self, full_name, email, phone_number, is_friend):
+        self.full_name = full_name
+        self.email = email
+        self.phone_number = phone_number
+        self.is_friend = is_friend
+
+
+def _sample_records(n_contacts):
+    for i in range(n_contacts):
+        yield (f'Contact {i}', f'contact{i}@example.com', f'555-{i % 10000:04d}', bool(i % 2))
+
+
+def _fill_table(records):
+    table = ContactTable()
+    table.extend(records)
+    return table
+
+
+def benchmark_contact_storage(n_contacts=200_000):
+    '''report bytes per contact for dict-backed objects, slotted Contact objects and a ContactTable'''
+    layouts = {
+        'dict Contact': lambda: [_DictContact(*r) for r in _sample_records(n_contacts)],
+        'slotted Contact': lambda: [Contact(*r) for r in _sample_records(n_contacts)],
+        'ContactTable': lambda: _fill_table(_sample_records(n_contacts)),
+    }
+    for label, build in layouts.items():
+        tracemalloc.start()
+        contacts = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:>15}: {size / len(contacts):8.1f} bytes/contact")
+        del contacts
+
+
 ############################################################################
 # Usage
 ############################################################################
 
 
-xml_reader = XMLReader('contacts.xml')
-# create an XML adapter and convert the data to a list of Contact objects
-xml_adapter = XMLContactsAdapter(xml_reader)
-# print the Contact objects
-print_contact_data(xml_adapter)
-
-json_reader = JSONReader('contacts.json')
-# create a JSON adapter and convert the data to a list of Contact objects
-json_adapter = JSONContactsAdapter(json_reader)
-# print the Contact objects
-print_contact_data(json_adapter)
-
-# expected output
-'''
-Patric Doe (patric.doe@example.com) - 777-1234 (Friend)
-Alex Smith (alex.smith@example.com) - 777-5678
-John Doe (john.doe@example.com) - 555-1234 (Friend)
-Jane Smith (jane.smith@example.com) - 555-5678
-Darren Walker (d.walker@example.com) - 555-9999 (Friend)
-'''
+def main():
+    # the sample files live next to this module
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    xml_reader = XMLReader(os.path.join(here, 'contacts.xml'))
+    # create an XML adapter and convert the data to a list of Contact objects
+    xml_adapter = XMLContactsAdapter(xml_reader)
+    # print the Contact objects
+    print_contact_data(xml_adapter)
+
+    json_reader = JSONReader(os.path.join(here, 'contacts.json'))
+    # create a JSON adapter and convert the data to a list of Contact objects
+    json_adapter = JSONContactsAdapter(json_reader)
+    # print the Contact objects
+    print_contact_data(json_adapter)
+
+    # expected output
+    '''
+    Patric Doe (patric.doe@example.com) - 777-1234 (Friend)
+    Alex Smith (alex.smith@example.com) - 777-5678
+    John Doe (john.doe@example.com) - 555-1234 (Friend)
+    Jane Smith (jane.smith@example.com) - 555-5678
+    Darren Walker (d.walker@example.com) - 555-9999 (Friend)
+    '''
+
+
+if __name__ == "__main__":
+    main()